@@ -10,4 +10,6 @@ def make_shell_context():
             'PhoneNumber': PhoneNumber,
             'Area': Area,
             'FosterSpecies': FosterSpecies,
+            'ClinicContact': ClinicContact,
+            'ArchivedVolunteer': ArchivedVolunteer,
             }
@@ -0,0 +1,23 @@
+import os
+
+# Preload mode: gunicorn -c gunicorn.conf.py foster_finder:app
+# The app is imported once in the master and forked into the workers, see main/preload.py
+
+bind = os.environ.get('BIND') or '127.0.0.1:8000'
+workers = int(os.environ.get('WEB_CONCURRENCY') or 4)
+# Threaded workers: every open Volunteer list page holds an /events stream (server-sent events) for as long as it is
+# open, which would take a whole sync worker and be killed by its timeout. With gthread a stream holds one thread,
+# and timeout only applies to the worker's heartbeat. Streams give their DB connection back before streaming.
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS') or 32)
+preload_app = True
+
+
+def when_ready(server):
+    from main import preload
+    preload.warm()
+
+
+def post_fork(server, worker):
+    from main import preload
+    preload.after_fork()
@@ -17,4 +17,4 @@ mail = Mail(app)
 
 
 # import at bottom to avoid cyclic imports
-from main import routes, models
+from main import routes, models, cli, assets, profiler, sqlite
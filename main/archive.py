@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, or_, and_, literal, DateTime
+
+from main import app, db, search_cache
+from main.models import Volunteer, PhoneNumber, ClinicContact, ArchivedVolunteer, ArchivedPhoneNumber, \
+    areas_volunteers, volunteers_species, archived_areas_volunteers, archived_volunteers_species, fill_clinic_contacts
+
+# Moves volunteers between the hot tables and the archive tables with INSERT ... SELECT + DELETE per batch of ids,
+# so no rows are loaded into the app. Both directions run inside the caller's transaction.
+
+volunteer = Volunteer.__table__
+phone_number = PhoneNumber.__table__
+clinic_contact = ClinicContact.__table__
+archived_volunteer = ArchivedVolunteer.__table__
+archived_phone_number = ArchivedPhoneNumber.__table__
+
+volunteer_columns = ['id', 'fname', 'lname', 'email', 'last_contacted', 'active', 'black_listed', 'notes', 'version']
+
+
+# Copies the rows of ids from every source table to its target, then deletes them from the source
+def _move(ids, tables):
+    for source, target, id_column, columns in tables:
+        db.session.execute(target.insert().from_select(
+            columns, select([source.c[c] for c in columns]).where(source.c[id_column].in_(ids))))
+        db.session.execute(source.delete().where(source.c[id_column].in_(ids)))
+
+
+# Black-listed volunteers, and inactive ones not contacted since the cutoff
+def candidates(cutoff, limit):
+    return [row[0] for row in db.session.execute(
+        select([volunteer.c.id])
+        .where(or_(volunteer.c.black_listed.is_(True),
+                   and_(volunteer.c.active.isnot(True), volunteer.c.last_contacted < cutoff)))
+        .order_by(volunteer.c.id)
+        .limit(limit))]
+
+
+def archive(ids):
+    search_cache.invalidate_all_on_commit(db.session)
+    now = datetime.utcnow()
+    db.session.execute(archived_volunteer.insert().from_select(
+        volunteer_columns + ['archived_at'],
+        select([volunteer.c[c] for c in volunteer_columns] + [literal(now, DateTime)])
+        .where(volunteer.c.id.in_(ids))))
+    # Per-clinic rotation positions are not kept, restore() gives the volunteer new rows at its last_contacted
+    db.session.execute(clinic_contact.delete().where(clinic_contact.c.volunteer_id.in_(ids)))
+    _move(ids, [
+        (phone_number, archived_phone_number, 'volunteer_id',
+         ['dial_code', 'phone_number', 'number', 'primary_contact', 'volunteer_id']),
+        (areas_volunteers, archived_areas_volunteers, 'vol_id', ['area', 'vol_id']),
+        (volunteers_species, archived_volunteers_species, 'vol_id', ['vol_id', 'foster_species']),
+    ])
+    db.session.execute(volunteer.delete().where(volunteer.c.id.in_(ids)))
+
+
+def restore(ids):
+    search_cache.invalidate_all_on_commit(db.session)
+    db.session.execute(volunteer.insert().from_select(
+        volunteer_columns, select([archived_volunteer.c[c] for c in volunteer_columns])
+        .where(archived_volunteer.c.id.in_(ids))))
+    fill_clinic_contacts(db.session, volunteer_ids=ids)
+    _move(ids, [
+        (archived_phone_number, phone_number, 'volunteer_id',
+         ['dial_code', 'phone_number', 'number', 'primary_contact', 'volunteer_id']),
+        (archived_areas_volunteers, areas_volunteers, 'vol_id', ['area', 'vol_id']),
+        (archived_volunteers_species, volunteers_species, 'vol_id', ['vol_id', 'foster_species']),
+    ])
+    db.session.execute(archived_volunteer.delete().where(archived_volunteer.c.id.in_(ids)))
+
+
+# Archives every candidate, committing after each batch so locks are only held for one batch at a time
+def run(days=None, batch_size=None):
+    cutoff = datetime.utcnow() - timedelta(days=days or app.config['ARCHIVE_AFTER_DAYS'])
+    batch_size = batch_size or app.config['ARCHIVE_BATCH_SIZE']
+    total = 0
+    while True:
+        ids = candidates(cutoff, batch_size)
+        if not ids:
+            return total
+        archive(ids)
+        db.session.commit()
+        total += len(ids)
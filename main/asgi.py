@@ -0,0 +1,115 @@
+import json
+from urllib.parse import parse_qs
+from http.cookies import SimpleCookie
+
+import databases
+from asgiref.wsgi import WsgiToAsgi
+from itsdangerous import BadSignature
+from sqlalchemy import select
+
+from main import app, queries, rotation
+from main.models import Clinic
+
+# Optional async deployment mode, run with an ASGI server: uvicorn main.asgi:application
+# The read-heavy JSON paths are served here with an async driver (aiomysql\aiosqlite through `databases`),
+# everything else, including all form routes, is passed on to the regular Flask app running in a thread pool.
+# Requires the packages in requirements-async.txt.
+
+
+# mysql+pymysql://... -> mysql://... which `databases` maps to aiomysql, sqlite URIs are used as they are
+def _async_database_url():
+    if app.config['ASYNC_DATABASE_URL']:
+        return app.config['ASYNC_DATABASE_URL']
+    return app.config['SQLALCHEMY_DATABASE_URI'].replace('+pymysql', '', 1)
+
+
+database = databases.Database(_async_database_url())
+flask_app = WsgiToAsgi(app)
+clinic = Clinic.__table__
+
+
+# Reads the clinic id from Flask's signed session cookie, the same way Flask-Login would.
+# Returns None when there is no usable session, the request is then left to Flask (login redirect, remember cookie).
+def _clinic_id(scope):
+    cookies = SimpleCookie()
+    for name, value in scope['headers']:
+        if name == b'cookie':
+            cookies.load(value.decode('latin-1'))
+    if app.session_cookie_name not in cookies:
+        return None
+
+    serializer = app.session_interface.get_signing_serializer(app)
+    try:
+        session = serializer.loads(cookies[app.session_cookie_name].value,
+                                   max_age=int(app.permanent_session_lifetime.total_seconds()))
+    except BadSignature:
+        return None
+    return int(session['_user_id']) if session.get('_user_id') else None
+
+
+def _page(args):
+    try:
+        return max(int(args.get('page', ['1'])[0]), 1)
+    except ValueError:
+        return 1
+
+
+async def api_queue(clinic_id, args):
+    areas = args.get('areas')
+    if not areas:
+        row = await database.fetch_one(select([clinic.c.area_name]).where(clinic.c.id == clinic_id))
+        areas = [row['area_name']] if row and row['area_name'] else []
+    rotation_clinic = clinic_id if app.config['PER_CLINIC_ROTATION'] else None
+    rows = await database.fetch_all(queries.rotation_queue(areas, args.get('species', []), rotation_clinic,
+                                                           _page(args)))
+    return {'volunteers': queries.serialize(rows)}
+
+
+async def api_search(clinic_id, args):
+    page = _page(args)
+    dial_code = args.get('dial_code', [None])[0]
+    phone_num = args.get('phone_number', [None])[0]
+    fname = args.get('fname', [None])[0]
+    lname = args.get('lname', [None])[0]
+
+    results = []
+    if dial_code and phone_num:
+        results = queries.serialize(await database.fetch_all(queries.volunteers_by_phone(dial_code, phone_num, page)))
+    if not results and (fname or lname):
+        results = queries.serialize(await database.fetch_all(queries.volunteers_by_name(fname, lname, page)))
+    return {'volunteers': results}
+
+
+async_routes = {
+    '/api/queue': api_queue,
+    '/api/search': api_search,
+}
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await database.connect()
+            rotation.start()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await database.disconnect()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+
+    handler = async_routes.get(scope['path']) if scope['type'] == 'http' and scope['method'] == 'GET' else None
+    clinic_id = _clinic_id(scope) if handler else None
+    if clinic_id is None:
+        return await flask_app(scope, receive, send)
+
+    body = json.dumps(await handler(clinic_id, parse_qs(scope['query_string'].decode('latin-1')))).encode('utf-8')
+    await send({'type': 'http.response.start', 'status': 200,
+                'headers': [(b'content-type', b'application/json'),
+                            (b'content-length', str(len(body)).encode('ascii'))]})
+    await send({'type': 'http.response.body', 'body': body})
@@ -0,0 +1,128 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+
+from flask import request, Response
+
+from main import app
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Static asset fingerprinting. url_for('static', filename='styles.css') is rewritten to a content-hashed name
+# (styles.<hash>.css) that is served from memory, precompressed, with a far-future immutable Cache-Control,
+# so browsers only re-download a file after it changes. The manifest is built on first use (or by preload.warm).
+# Disabled in debug mode so edits to static files show up without a restart.
+
+CACHE_MAX_AGE = 365 * 24 * 60 * 60
+COMPRESSIBLE_ASSETS = ('text/css', 'application/javascript', 'image/svg+xml', 'text/plain')
+# Dynamic responses compressed on the way out
+COMPRESSIBLE_RESPONSES = ('text/html', 'application/json')
+COMPRESS_MIN_SIZE = 500
+
+
+class Asset(object):
+    __slots__ = ('mimetype', 'etag', 'variants')
+
+    def __init__(self, mimetype, etag, variants):
+        self.mimetype = mimetype
+        self.etag = etag
+        # Content-Encoding -> body, compressed variants are only kept if they are smaller
+        self.variants = variants
+
+
+_assets = None
+_hashed_names = None
+_lock = threading.Lock()
+
+
+def _load(data, mimetype):
+    variants = {'identity': data}
+    if mimetype in COMPRESSIBLE_ASSETS:
+        compressed = gzip.compress(data, 9)
+        if len(compressed) < len(data):
+            variants['gzip'] = compressed
+        if brotli is not None:
+            compressed = brotli.compress(data)
+            if len(compressed) < len(data):
+                variants['br'] = compressed
+    return variants
+
+
+def _build():
+    assets = {}
+    hashed_names = {}
+    for root, dirs, files in os.walk(app.static_folder):
+        for name in files:
+            path = os.path.join(root, name)
+            filename = os.path.relpath(path, app.static_folder).replace(os.sep, '/')
+            with open(path, 'rb') as f:
+                data = f.read()
+
+            digest = hashlib.md5(data).hexdigest()[:12]
+            base, ext = os.path.splitext(filename)
+            hashed_name = '%s.%s%s' % (base, digest, ext)
+            mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+            assets[hashed_name] = Asset(mimetype, digest, _load(data, mimetype))
+            hashed_names[filename] = hashed_name
+    return assets, hashed_names
+
+
+# Returns {original filename: hashed filename}, building the manifest on first use
+def manifest():
+    global _assets, _hashed_names
+    if _hashed_names is None:
+        with _lock:
+            if _hashed_names is None:
+                _assets, _hashed_names = _build()
+    return _hashed_names
+
+
+@app.url_defaults
+def fingerprint_static_url(endpoint, values):
+    if endpoint == 'static' and not app.debug:
+        values['filename'] = manifest().get(values['filename'], values['filename'])
+
+
+# Replaces Flask's static view. Unhashed names (or anything added after the manifest was built) are still served
+# by send_static_file with the default caching.
+def static_file(filename):
+    manifest()
+    asset = _assets.get(filename)
+    if asset is None:
+        return app.send_static_file(filename)
+
+    encoding = request.accept_encodings.best_match(list(asset.variants), default='identity')
+    response = Response(asset.variants[encoding], mimetype=asset.mimetype)
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.set_etag(asset.etag)
+    response.headers['Cache-Control'] = 'public, max-age=%d, immutable' % CACHE_MAX_AGE
+    return response
+
+
+app.view_functions['static'] = static_file
+
+
+@app.after_request
+def compress_response(response):
+    if response.mimetype not in COMPRESSIBLE_RESPONSES \
+            or response.direct_passthrough or response.is_streamed \
+            or 'Content-Encoding' in response.headers \
+            or not request.accept_encodings['gzip']:
+        return response
+
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+
+    response.set_data(gzip.compress(data, 6))
+    response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    return response
@@ -0,0 +1,82 @@
+import logging
+import time
+from datetime import datetime
+
+from alembic import op
+from flask import current_app
+from sqlalchemy import select, and_, func
+
+from main.models import BackfillProgress
+
+# Online data backfills for migrations. Instead of one UPDATE over the whole table, which locks it for as long as
+# it runs, rows are walked in primary key order and updated a chunk at a time, each chunk in its own short
+# transaction, with a pause in between so regular traffic gets its turn.
+# Progress is checkpointed in backfill_progress under the backfill's name: a migration interrupted half way resumes
+# from the last finished chunk when `flask db upgrade` is run again, and a finished backfill is not repeated.
+#
+# Keep the DDL (e.g. adding the column) in an earlier revision than the backfill: the backfill commits as it goes,
+# so a rerun of its revision must not repeat anything that isn't idempotent.
+#
+#     clinic = sa.table('clinic', sa.column('id', sa.Integer), sa.column('active', sa.Boolean))
+#     backfill('clinic.active', clinic, {'active': True}, clinic.c.active.is_(None))
+#
+# pk is the integer column walked, it doesn't have to be unique: every row of the values in a chunk is updated
+# together (e.g. phone numbers walked by volunteer_id). With --sql (offline mode) a single UPDATE is emitted instead.
+
+logger = logging.getLogger('alembic.backfill')
+progress = BackfillProgress.__table__
+
+
+def _checkpoint(bind, name):
+    return bind.execute(select([progress]).where(progress.c.name == name)).first()
+
+
+def backfill(name, table, values, where, pk='id', batch_size=None, pause=None):
+    batch_size = batch_size or current_app.config['BACKFILL_BATCH_SIZE']
+    pause = pause if pause is not None else current_app.config['BACKFILL_PAUSE_MS'] / 1000.0
+    context = op.get_context()
+    if context.as_sql:
+        op.execute(table.update().where(where).values(values))
+        return
+
+    # Commits the migration's transaction so far, every statement below is committed on its own
+    with context.autocommit_block():
+        bind = op.get_bind()
+        id_column = table.c[pk]
+        checkpoint = _checkpoint(bind, name)
+        if checkpoint is not None and checkpoint.finished:
+            logger.info('%s: already done', name)
+            return
+        if checkpoint is None:
+            bind.execute(progress.insert().values(name=name, last_id=0, rows=0, finished=False,
+                                                  updated_at=datetime.utcnow()))
+            last_id, done = 0, 0
+        else:
+            last_id, done = checkpoint.last_id, checkpoint.rows
+            logger.info('%s: resuming after %s %d', name, pk, last_id)
+
+        remaining = bind.execute(select([func.count()]).select_from(table)
+                                 .where(and_(where, id_column > last_id))).scalar()
+        logger.info('%s: %d rows to update', name, remaining)
+        started = time.monotonic()
+        updated = 0
+        while True:
+            ids = [row[0] for row in bind.execute(
+                select([id_column]).where(and_(where, id_column > last_id)).order_by(id_column).limit(batch_size))]
+            if not ids:
+                break
+            # where is repeated so rows changed since they were selected are left alone
+            result = bind.execute(table.update().where(and_(id_column.in_(ids), where)).values(values))
+            last_id = ids[-1]
+            updated += result.rowcount
+            bind.execute(progress.update().where(progress.c.name == name)
+                         .values(last_id=last_id, rows=done + updated, updated_at=datetime.utcnow()))
+            elapsed = time.monotonic() - started
+            logger.info('%s: %d/%d rows (%.0f%%), %.0f rows/s', name, updated, remaining,
+                        100.0 * updated / remaining if remaining else 100, updated / elapsed if elapsed else 0)
+            if pause:
+                time.sleep(pause)
+
+        bind.execute(progress.update().where(progress.c.name == name)
+                     .values(finished=True, updated_at=datetime.utcnow()))
+        logger.info('%s: done, %d rows updated', name, done + updated)
@@ -0,0 +1,178 @@
+import logging
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, and_, or_, func, literal, Integer, String
+
+from main import app, db, bulk, email
+from main.models import Broadcast, BroadcastRecipient, Volunteer
+
+# Foster request broadcasts: one email to every active, non black-listed volunteer with an email address in any of
+# the chosen areas fostering any of the chosen species.
+#
+# Creating a broadcast copies the matching volunteers into broadcast_recipient with one INSERT ... SELECT, so the
+# recipient list is fixed when the request is made and never loaded into the app. Sending walks the pending
+# recipients in volunteer_id order BROADCAST_BATCH_SIZE at a time: every batch is rendered, sent over one SMTP
+# connection at most BROADCAST_RATE messages per second, and its statuses committed before the next batch is read.
+# A sender that dies half way leaves the rest pending, `flask send-broadcasts` picks them up again.
+#
+# Before a batch is sent its recipients are claimed with one conditional UPDATE (pending and not claimed in the
+# last BROADCAST_CLAIM_SECONDS) that stamps them with the sender's id, so a background sender and
+# `flask send-broadcasts` running at the same time never mail the same volunteer twice: a sender only mails the rows
+# carrying its own stamp. Claims of a sender that died expire, and its recipients are sent by the next run.
+
+PENDING = 'pending'
+SENT = 'sent'
+FAILED = 'failed'
+
+logger = logging.getLogger(__name__)
+volunteer = Volunteer.__table__
+recipient = BroadcastRecipient.__table__
+
+
+def recipient_conditions(areas, species):
+    return bulk.filter_conditions({'areas': areas, 'species': species}) + [
+        volunteer.c.active.is_(True), volunteer.c.black_listed.isnot(True),
+        volunteer.c.email.isnot(None), volunteer.c.email != '']
+
+
+def count(areas, species):
+    return db.session.execute(select([func.count()]).select_from(volunteer)
+                              .where(and_(*recipient_conditions(areas, species)))).scalar()
+
+
+# Creates the broadcast and its recipients in the caller's transaction, returns it with the number of recipients
+def create(clinic_id, subject, message, areas, species):
+    broadcast = Broadcast(clinic_id=clinic_id, subject=subject, message=message, areas=','.join(areas),
+                          species=','.join(species))
+    db.session.add(broadcast)
+    db.session.flush()
+    result = db.session.execute(recipient.insert().from_select(
+        ['broadcast_id', 'volunteer_id', 'email', 'status'],
+        select([literal(broadcast.id, Integer), volunteer.c.id, volunteer.c.email, literal(PENDING, String)])
+        .where(and_(*recipient_conditions(areas, species)))))
+    return broadcast, result.rowcount
+
+
+def _pending(broadcast_id, after_id, size):
+    # Outer join, a volunteer archived since the broadcast was created is still sent to, without a name
+    return db.session.execute(
+        select([recipient.c.volunteer_id, recipient.c.email, volunteer.c.fname, volunteer.c.lname])
+        .select_from(recipient.outerjoin(volunteer, volunteer.c.id == recipient.c.volunteer_id))
+        .where(and_(recipient.c.broadcast_id == broadcast_id, recipient.c.status == PENDING,
+                    recipient.c.volunteer_id > after_id))
+        .order_by(recipient.c.volunteer_id)
+        .limit(size)).fetchall()
+
+
+# Claims the rows for the sender with one UPDATE, returns the ones claimed. Committed before anything is sent.
+def _claim(broadcast_id, rows, sender):
+    now = datetime.utcnow()
+    expired = now - timedelta(seconds=app.config['BROADCAST_CLAIM_SECONDS'])
+    ids = [row.volunteer_id for row in rows]
+    batch = and_(recipient.c.broadcast_id == broadcast_id, recipient.c.volunteer_id.in_(ids),
+                 recipient.c.status == PENDING)
+    claimed = db.session.execute(
+        recipient.update()
+        .where(and_(batch, or_(recipient.c.claimed_at.is_(None), recipient.c.claimed_at < expired)))
+        .values(claimed_at=now, claimed_by=sender)).rowcount
+    # Only looks up which ones when another sender holds part of the batch
+    if claimed < len(rows):
+        ids = {row[0] for row in db.session.execute(
+            select([recipient.c.volunteer_id]).where(and_(batch, recipient.c.claimed_by == sender)))}
+        rows = [row for row in rows if row.volunteer_id in ids]
+    db.session.commit()
+    return rows
+
+
+def _record(broadcast_id, rows, results):
+    now = datetime.utcnow()
+    # Rows not attempted (dropped connection) are released, so this sender's next batch can claim them again
+    unsent = [row.volunteer_id for row in rows[len(results):]]
+    if unsent:
+        db.session.execute(recipient.update()
+                           .where(and_(recipient.c.broadcast_id == broadcast_id, recipient.c.volunteer_id.in_(unsent)))
+                           .values(claimed_at=None, claimed_by=None))
+    sent = [row.volunteer_id for row, error in zip(rows, results) if error is None]
+    if sent:
+        db.session.execute(recipient.update()
+                           .where(and_(recipient.c.broadcast_id == broadcast_id, recipient.c.volunteer_id.in_(sent)))
+                           .values(status=SENT, sent_at=now))
+    for row, error in zip(rows, results):
+        if error is not None:
+            db.session.execute(recipient.update()
+                               .where(and_(recipient.c.broadcast_id == broadcast_id,
+                                           recipient.c.volunteer_id == row.volunteer_id))
+                               .values(status=FAILED, error=error, sent_at=now))
+    db.session.commit()
+
+
+# Sends every pending recipient of the broadcast, returns the number of messages attempted
+def send(broadcast_id, batch_size=None, rate=None):
+    batch_size = batch_size or app.config['BROADCAST_BATCH_SIZE']
+    rate = rate if rate is not None else app.config['BROADCAST_RATE']
+    broadcast = Broadcast.query.get(broadcast_id)
+    throttle = email.Throttle(rate)
+    # Marks this sender's claims, timestamps alone could be the same for two senders
+    sender = uuid.uuid4().hex
+    total = 0
+    after_id = 0
+    while True:
+        rows = _pending(broadcast_id, after_id, batch_size)
+        if not rows:
+            break
+        # Rows claimed by another sender are left to it
+        claimed = _claim(broadcast_id, rows, sender)
+        after_id = rows[-1].volunteer_id
+        if not claimed:
+            continue
+        try:
+            results = email.send_batch([email.broadcast_message(broadcast, row) for row in claimed], throttle)
+        except Exception:
+            _record(broadcast_id, claimed, [])
+            raise
+        _record(broadcast_id, claimed, results)
+        total += len(results)
+        # A dropped connection leaves the rest of the batch pending, the next batch starts at the first of them
+        if results and len(results) < len(claimed):
+            after_id = claimed[len(results) - 1].volunteer_id
+        logger.info('Broadcast %d: %d messages sent', broadcast_id, total)
+
+    # Recipients still claimed by another sender keep the broadcast unfinished until they are sent
+    if not _pending(broadcast_id, 0, 1):
+        broadcast.finished_at = datetime.utcnow()
+    db.session.commit()
+    return total
+
+
+def _send_in_background(broadcast_id):
+    with app.app_context():
+        try:
+            send(broadcast_id)
+        except Exception:
+            logger.exception('Broadcast %d stopped, resume it with `flask send-broadcasts`', broadcast_id)
+        finally:
+            db.session.remove()
+
+
+# Sends a committed broadcast from a thread of this process, so the page returns right away
+def start(broadcast_id):
+    threading.Thread(target=_send_in_background, args=(broadcast_id,), daemon=True).start()
+
+
+def unfinished():
+    return [row[0] for row in db.session.query(Broadcast.id).filter(Broadcast.finished_at.is_(None))
+            .order_by(Broadcast.id)]
+
+
+# {broadcast id: {status: recipients}} for the given broadcasts
+def status_counts(broadcast_ids):
+    counts = {id: {PENDING: 0, SENT: 0, FAILED: 0} for id in broadcast_ids}
+    if broadcast_ids:
+        for broadcast_id, status, recipients in db.session.execute(
+                select([recipient.c.broadcast_id, recipient.c.status, func.count()])
+                .where(recipient.c.broadcast_id.in_(broadcast_ids))
+                .group_by(recipient.c.broadcast_id, recipient.c.status)):
+            counts[broadcast_id][status] = recipients
+    return counts
@@ -0,0 +1,104 @@
+from sqlalchemy import select, and_, exists, literal, String
+
+from main import app, db, stats, rotation
+from main.models import Volunteer, areas_volunteers, volunteers_species
+
+# Set-based bulk changes to volunteers for admins (the bulk page and `flask bulk-volunteers`).
+# Volunteers are selected by filter and changed with UPDATE\INSERT ... SELECT\DELETE statements on chunks of ids,
+# walking the matching ids in order and committing after every chunk, so no volunteer is loaded into the session
+# and locks are only held for one chunk at a time.
+#
+# filters: areas, species (any of), contacted_after, contacted_before (datetimes), active, black_listed (bools),
+#   a missing or None entry doesn't filter.
+# changes: active, black_listed (bools), add_areas, remove_areas, add_species, remove_species (lists),
+#   a missing or None entry doesn't change anything.
+#
+# Live volunteers only, archived ones are left alone. Roster statistics are reconciled once at the end.
+# No rotation queue events are sent for bulk changes, dispatcher pages and the rotation index of other processes
+# catch up on their next reload\check.
+
+volunteer = Volunteer.__table__
+
+
+# Conditions on the volunteer table selecting the volunteers matching filters, also used by main.broadcast
+def filter_conditions(filters):
+    conditions = []
+    if filters.get('areas'):
+        conditions.append(exists().where(and_(areas_volunteers.c.vol_id == volunteer.c.id,
+                                              areas_volunteers.c.area.in_(filters['areas']))))
+    if filters.get('species'):
+        conditions.append(exists().where(and_(volunteers_species.c.vol_id == volunteer.c.id,
+                                              volunteers_species.c.foster_species.in_(filters['species']))))
+    if filters.get('contacted_after') is not None:
+        conditions.append(volunteer.c.last_contacted >= filters['contacted_after'])
+    if filters.get('contacted_before') is not None:
+        conditions.append(volunteer.c.last_contacted < filters['contacted_before'])
+    if filters.get('active') is not None:
+        conditions.append(volunteer.c.active.is_(filters['active']))
+    if filters.get('black_listed') is not None:
+        conditions.append(volunteer.c.black_listed.is_(filters['black_listed']))
+    return conditions
+
+
+def count(filters):
+    return db.session.execute(select([db.func.count()]).select_from(volunteer)
+                              .where(and_(*filter_conditions(filters)))).scalar()
+
+
+def _chunk(conditions, after_id, size):
+    return [row[0] for row in db.session.execute(
+        select([volunteer.c.id]).where(and_(volunteer.c.id > after_id, *conditions))
+        .order_by(volunteer.c.id).limit(size))]
+
+
+# Adds (vol_id, value) rows for every id of ids that doesn't have them yet
+def _add(table, vol_id_column, value_column, ids, values):
+    for value in values:
+        db.session.execute(table.insert().from_select(
+            [vol_id_column.name, value_column.name],
+            select([volunteer.c.id, literal(value, String)])
+            .where(volunteer.c.id.in_(ids))
+            .where(~exists().where(and_(vol_id_column == volunteer.c.id, value_column == value)))))
+
+
+def _apply_chunk(ids, changes):
+    # The version bump makes edit forms opened before the change fail their check instead of overwriting it
+    values = {volunteer.c.version: volunteer.c.version + 1}
+    if changes.get('active') is not None:
+        values[volunteer.c.active] = changes['active']
+    if changes.get('black_listed') is not None:
+        values[volunteer.c.black_listed] = changes['black_listed']
+    db.session.execute(volunteer.update().where(volunteer.c.id.in_(ids)).values(values))
+
+    if changes.get('remove_areas'):
+        db.session.execute(areas_volunteers.delete().where(and_(areas_volunteers.c.vol_id.in_(ids),
+                                                                areas_volunteers.c.area.in_(changes['remove_areas']))))
+    if changes.get('remove_species'):
+        db.session.execute(volunteers_species.delete().where(and_(
+            volunteers_species.c.vol_id.in_(ids), volunteers_species.c.foster_species.in_(changes['remove_species']))))
+    _add(areas_volunteers, areas_volunteers.c.vol_id, areas_volunteers.c.area, ids, changes.get('add_areas') or [])
+    _add(volunteers_species, volunteers_species.c.vol_id, volunteers_species.c.foster_species, ids,
+         changes.get('add_species') or [])
+
+
+# Applies changes to every volunteer matching filters, returns the number of volunteers changed
+def apply(filters, changes, chunk_size=None):
+    if all(not value and value is not False for value in changes.values()):
+        return 0
+    chunk_size = chunk_size or app.config['BULK_CHUNK_SIZE']
+    conditions = filter_conditions(filters)
+    total = 0
+    after_id = 0
+    while True:
+        ids = _chunk(conditions, after_id, chunk_size)
+        if not ids:
+            break
+        _apply_chunk(ids, changes)
+        db.session.commit()
+        total += len(ids)
+        after_id = ids[-1]
+
+    if total:
+        stats.reconcile()
+        rotation.index.expire()
+    return total
@@ -0,0 +1,211 @@
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+import click
+
+from main import app, archive, stats, simulate, sqlite, bulk, broadcast
+from main.smtp_stub import SmtpStub
+
+
+# Signs a session cookie for the given clinic, as Flask-Login would after logging in
+def _session_cookie(clinic_id):
+    serializer = app.session_interface.get_signing_serializer(app)
+    return '%s=%s' % (app.session_cookie_name, serializer.dumps({'_user_id': str(clinic_id), '_fresh': True}))
+
+
+async def _get(host, port, path, cookie):
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(('GET %s HTTP/1.1\r\nHost: %s\r\nCookie: %s\r\nConnection: close\r\n\r\n'
+                  % (path, host, cookie)).encode('latin-1'))
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    await reader.read()
+    writer.close()
+    return status
+
+
+async def _run_clients(url, clients, per_client, cookie):
+    parts = urlsplit(url)
+    path = parts.path + ('?' + parts.query if parts.query else '')
+    latencies = []
+    errors = []
+
+    async def client():
+        for _ in range(per_client):
+            start = time.perf_counter()
+            try:
+                status = await _get(parts.hostname, parts.port or 80, path, cookie)
+            except OSError as e:
+                errors.append(e)
+                continue
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors.append(status)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(clients)])
+    return time.perf_counter() - start, latencies, errors
+
+
+def _percentile(values, percent):
+    return values[min(int(len(values) * percent / 100), len(values) - 1)] if values else 0
+
+
+@app.cli.command('loadtest')
+@click.argument('url')
+@click.option('--clients', default=200, help='Concurrent clients.')
+@click.option('--requests', 'per_client', default=20, help='Requests sent by every client.')
+@click.option('--clinic-id', default=1, help='Clinic to authenticate as.')
+def loadtest(url, clients, per_client, clinic_id):
+    """Measures throughput and latency of URL under concurrent clients.
+
+    Run it against the same endpoint served by the sync server and by main.asgi to compare the two modes,
+    e.g. flask loadtest http://127.0.0.1:8000/api/queue?areas=North
+    """
+    elapsed, latencies, errors = asyncio.get_event_loop().run_until_complete(
+        _run_clients(url, clients, per_client, _session_cookie(clinic_id)))
+    latencies.sort()
+    click.echo('%d requests in %.2fs, %.1f req/s, %d errors' % (len(latencies), elapsed, len(latencies) / elapsed,
+                                                                  len(errors)))
+    click.echo('latency p50 %.1fms  p95 %.1fms  p99 %.1fms' % (_percentile(latencies, 50) * 1000,
+                                                              _percentile(latencies, 95) * 1000,
+                                                              _percentile(latencies, 99) * 1000))
+
+
+@app.cli.command('archive')
+@click.option('--days', type=int, help='Archive inactive volunteers not contacted for this many days.')
+@click.option('--batch-size', type=int, help='Volunteers moved per transaction.')
+def archive_volunteers(days, batch_size):
+    """Moves black-listed and long inactive volunteers to the archive tables."""
+    click.echo('Archived %d volunteers' % archive.run(days, batch_size))
+
+
+@app.cli.command('bulk-volunteers')
+@click.option('--area', 'areas', multiple=True, help='Only volunteers in any of these areas.')
+@click.option('--species', multiple=True, help='Only volunteers fostering any of these species.')
+@click.option('--contacted-after', type=click.DateTime(), help='Only volunteers last contacted at or after this.')
+@click.option('--contacted-before', type=click.DateTime(), help='Only volunteers last contacted before this.')
+@click.option('--active/--inactive', default=None, help='Only active\\inactive volunteers.')
+@click.option('--black-listed/--not-black-listed', default=None, help='Only black-listed\\other volunteers.')
+@click.option('--set-active', type=click.Choice(['yes', 'no']), help='Activate or deactivate them.')
+@click.option('--set-black-listed', type=click.Choice(['yes', 'no']), help='Black-list them or lift it.')
+@click.option('--add-area', 'add_areas', multiple=True, help='Area to add to them.')
+@click.option('--remove-area', 'remove_areas', multiple=True, help='Area to remove from them.')
+@click.option('--add-species', multiple=True, help='Species to add to them.')
+@click.option('--remove-species', multiple=True, help='Species to remove from them.')
+@click.option('--chunk-size', type=int, help='Volunteers changed per transaction.')
+@click.option('--dry-run', is_flag=True, help='Only count the matching volunteers.')
+def bulk_volunteers(areas, species, contacted_after, contacted_before, active, black_listed, set_active,
+                    set_black_listed, add_areas, remove_areas, add_species, remove_species, chunk_size, dry_run):
+    """Changes every volunteer matching the filters with set-based statements, e.g.
+    flask bulk-volunteers --active --contacted-before 2020-01-01 --set-active no
+    """
+    filters = {'areas': areas, 'species': species, 'contacted_after': contacted_after,
+               'contacted_before': contacted_before, 'active': active, 'black_listed': black_listed}
+    click.echo('%d volunteers match' % bulk.count(filters))
+    if dry_run:
+        return
+    changes = {'active': {'yes': True, 'no': False}.get(set_active),
+               'black_listed': {'yes': True, 'no': False}.get(set_black_listed),
+               'add_areas': add_areas, 'remove_areas': remove_areas,
+               'add_species': add_species, 'remove_species': remove_species}
+    click.echo('Changed %d volunteers' % bulk.apply(filters, changes, chunk_size))
+
+
+@app.cli.command('send-broadcasts')
+@click.option('--id', 'broadcast_ids', multiple=True, type=int,
+              help='Broadcast to send, repeatable. All unfinished ones when not given.')
+@click.option('--rate', type=float, help='Messages per second (BROADCAST_RATE by default, 0 for no limit).')
+def send_broadcasts(broadcast_ids, rate):
+    """Sends the pending recipients of foster request broadcasts, e.g. those left by a restarted server.
+
+    Safe to run while the server is still sending: every recipient is claimed by one sender before it is mailed,
+    and recipients claimed by a sender that stopped are sent once the claim is BROADCAST_CLAIM_SECONDS old.
+    """
+    for broadcast_id in broadcast_ids or broadcast.unfinished():
+        click.echo('Broadcast %d: %d messages sent' % (broadcast_id, broadcast.send(broadcast_id, rate=rate)))
+
+
+@app.cli.command('reconcile-stats')
+def reconcile_stats():
+    """Rebuilds the roster statistics counters from the volunteer tables."""
+    stats.reconcile()
+    click.echo('Roster statistics reconciled')
+
+
+@app.cli.command('simulate')
+@click.option('--dispatchers', default=8, help='Concurrent dispatchers.')
+@click.option('--clinic-id', 'clinic_ids', multiple=True, type=int,
+              help='Clinic the dispatchers log in as, repeat for several (assigned in turn).')
+@click.option('--area', 'areas', multiple=True, required=True, help='Area worked by the dispatchers, repeatable.')
+@click.option('--species', multiple=True, required=True, help='Species worked by the dispatchers, repeatable.')
+@click.option('--duration', default=30.0, help='Seconds to run.')
+@click.option('--call-ms', default=200, help='Time spent "calling" each volunteer before cycling them.')
+@click.option('--url', help='Base url of a running server, the app is driven in-process when not given.')
+@click.option('--seed', 'seed_volunteers', type=int, default=0,
+              help='Create a clinic per dispatcher and this many volunteers before running (local dbs only).')
+def simulate_dispatchers(dispatchers, clinic_ids, areas, species, duration, call_ms, url, seed_volunteers):
+    """Simulates dispatchers at several clinics working the same rotation queue.
+
+    Reports throughput, latency and duplicate hand-outs (one volunteer shown to two dispatchers at once).
+    In-process runs send email to a local SMTP stub, run `flask smtp-stub` for the server under --url.
+    """
+    if seed_volunteers:
+        clinic_ids = simulate.seed(dispatchers, seed_volunteers, areas, species)
+    if not clinic_ids:
+        raise click.UsageError('Pass --clinic-id or --seed')
+    clinic_ids = [clinic_ids[i % len(clinic_ids)] for i in range(dispatchers)]
+
+    if url:
+        clients = [simulate.HttpClient(url, _session_cookie(clinic_id)) for clinic_id in clinic_ids]
+    else:
+        smtp = SmtpStub().start()
+        simulate.use_mail_server('127.0.0.1', smtp.port)
+        clients = [simulate.InProcessClient(clinic_id) for clinic_id in clinic_ids]
+
+    elapsed, result = simulate.run(clients, areas, species, duration, call_ms / 1000.0)
+    hand_outs = len(result.hand_outs)
+    duplicates = result.duplicates()
+    click.echo('%d hand-outs in %.2fs, %.1f/s, %d errors, %d empty queues' % (
+        hand_outs, elapsed, hand_outs / elapsed, len(result.errors), result.empty))
+    for name, latencies in (('index', result.index_latencies), ('contact', result.contact_latencies),
+                            ('cycle', result.cycle_latencies)):
+        latencies.sort()
+        click.echo('%s latency p50 %.1fms  p95 %.1fms  p99 %.1fms' % (name, _percentile(latencies, 50) * 1000,
+                                                                     _percentile(latencies, 95) * 1000,
+                                                                     _percentile(latencies, 99) * 1000))
+    click.echo('duplicate hand-outs %d (%.1f%%)' % (duplicates, 100.0 * duplicates / hand_outs if hand_outs else 0))
+    if result.errors:
+        click.echo('first errors: %s' % ', '.join(str(e) for e in result.errors[:5]))
+    # Nothing handed out means the dispatchers never got a volunteer to call, not a quiet run
+    if not hand_outs:
+        raise click.ClickException('No volunteer was handed out, check --area\\--species and the index page')
+
+
+@app.cli.command('smtp-stub')
+@click.option('--port', default=8025, help='Port to listen on.')
+def smtp_stub(port):
+    """Runs a local SMTP server that accepts and drops all mail (set MAIL_SERVER=localhost MAIL_PORT=<port>)."""
+    server = SmtpStub(port=port)
+    click.echo('SMTP stub listening on 127.0.0.1:%d' % server.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        click.echo('%d messages received' % server.messages)
+
+
+@app.cli.command('sqlite-bench')
+@click.option('--readers', default=8, help='Reader processes (rotation queue queries).')
+@click.option('--writers', default=4, help='Writer processes (cycle_to_bottom updates).')
+@click.option('--seconds', default=20, help='Seconds to run.')
+def sqlite_bench(readers, writers, seconds):
+    """Runs concurrent readers and writers against the configured SQLite db and reports "database is locked" errors.
+
+    Needs volunteers in the db (e.g. from flask simulate --seed). Compare SQLITE_TUNED=0 with the default profile.
+    """
+    for kind, (operations, locked, latencies) in sorted(sqlite.benchmark(readers, writers, seconds).items()):
+        latencies.sort()
+        click.echo('%ss: %.1f ops/s, %d locked, p50 %.1fms  p99 %.1fms  max %.1fms' % (
+            kind, operations / float(seconds), locked, _percentile(latencies, 50) * 1000,
+            _percentile(latencies, 99) * 1000, (latencies[-1] if latencies else 0) * 1000))
@@ -1,3 +1,6 @@
+import smtplib
+import time
+
 from flask import render_template
 from flask_mail import Message
 from main import mail, app
@@ -18,4 +21,47 @@ def send_password_reset_email(clinic):
                text_body=render_template('reset_password_email.txt',
                                          clinic=clinic, token=token),
                html_body=render_template('reset_password_email.html',
-                                         clinic=clinic, token=token))
\ No newline at end of file
+                                         clinic=clinic, token=token))
+
+
+def broadcast_message(broadcast, recipient):
+    msg = Message(broadcast.subject, sender=app.config['ADMIN'], recipients=[recipient.email],
+                  reply_to=broadcast.clinic.email)
+    msg.body = render_template('broadcast_email.txt', broadcast=broadcast, recipient=recipient)
+    msg.html = render_template('broadcast_email.html', broadcast=broadcast, recipient=recipient)
+    return msg
+
+
+# Spaces calls to wait() at least 1/rate seconds apart, no limit when rate is not set.
+# Shared by the batches of a broadcast, so the rate holds across connections too.
+class Throttle(object):
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self.next = time.monotonic()
+
+    def wait(self):
+        if self.interval:
+            time.sleep(max(self.next - time.monotonic(), 0))
+            self.next = max(self.next, time.monotonic()) + self.interval
+
+
+# Sends messages over a single SMTP connection, waiting on throttle before each of them.
+# Returns one entry per message attempted, None when it was sent or the error when the server refused it.
+# Stops early if the server drops the connection, the messages not attempted are left to the caller.
+def send_batch(messages, throttle=None):
+    results = []
+    try:
+        with mail.connect() as connection:
+            for msg in messages:
+                if throttle is not None:
+                    throttle.wait()
+                try:
+                    connection.send(msg)
+                except (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException) as e:
+                    results.append(str(e)[:200])
+                    continue
+                results.append(None)
+    except smtplib.SMTPServerDisconnected:
+        if not results:
+            raise
+    return results
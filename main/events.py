@@ -0,0 +1,149 @@
+import json
+import queue
+import threading
+
+from flask import current_app
+
+
+# Event types pushed to dispatchers watching the rotation queue
+CYCLED = 'cycled'
+EDITED = 'edited'
+DEACTIVATED = 'deactivated'
+ADDED = 'added'
+# Search values written, see main.search_cache. Not delivered to dispatchers (no areas\species).
+SEARCH_CHANGED = 'search_changed'
+
+
+class Subscriber(object):
+    def __init__(self, areas, species, max_size):
+        self.areas = set(areas)
+        self.species = set(species)
+        self.queue = queue.Queue(maxsize=max_size)
+        # Set when events had to be dropped, the client is then told to reload instead of trusting partial updates
+        self.overflowed = False
+
+    def wants(self, event):
+        return bool(self.areas.intersection(event['areas'])) and bool(self.species.intersection(event['species']))
+
+    def offer(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.overflowed = True
+
+
+class EventHub(object):
+    # In-process fan-out. Every subscriber has its own bounded queue so a slow client can't hold up the others.
+    def __init__(self):
+        self._subscribers = set()
+        # Callbacks for in-process consumers (e.g. the rotation index), called with every event
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, areas, species, max_size=100):
+        subscriber = Subscriber(areas, species, max_size)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def add_listener(self, listener):
+        with self._lock:
+            self._listeners.append(listener)
+
+    def deliver(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener(event)
+        for subscriber in subscribers:
+            if subscriber.wants(event):
+                subscriber.offer(event)
+
+
+class LocalBackend(object):
+    # Single process stand-in, delivers straight to this worker's hub
+    def __init__(self, hub):
+        self.hub = hub
+
+    def publish(self, event):
+        self.hub.deliver(event)
+
+
+class RedisBackend(object):
+    # Relays events between workers through redis pub/sub. Requires the redis package, only imported when used.
+    def __init__(self, hub, url, channel='foster_finder.events'):
+        import redis
+
+        self.hub = hub
+        self.channel = channel
+        self.client = redis.Redis.from_url(url)
+        self._listener = threading.Thread(target=self._listen, daemon=True)
+        self._listener.start()
+
+    def _listen(self):
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.channel)
+        for message in pubsub.listen():
+            self.hub.deliver(json.loads(message['data']))
+
+    def publish(self, event):
+        self.client.publish(self.channel, json.dumps(event))
+
+
+hub = EventHub()
+_backend = None
+_backend_lock = threading.Lock()
+
+
+# Backend is created on first use rather than at import, so no threads or connections exist before workers fork
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if current_app.config['EVENTS_BACKEND'] == 'redis':
+                    _backend = RedisBackend(hub, current_app.config['EVENTS_REDIS_URL'])
+                else:
+                    _backend = LocalBackend(hub)
+    return _backend
+
+
+# areas\species are the names the event is delivered for, for an edit they include the volunteer's old ones so
+# dispatchers watching those are notified too. Taken as names so publishing after a commit doesn't reload the volunteer.
+def publish_volunteer_event(event_type, volunteer_id, clinic_id, areas, species):
+    get_backend().publish({
+        'type': event_type,
+        'volunteer_id': volunteer_id,
+        'clinic_id': clinic_id,
+        'areas': sorted(set(areas)),
+        'species': sorted(set(species)),
+    })
+
+
+def publish_search_change(rows):
+    get_backend().publish({'type': SEARCH_CHANGED, 'rows': rows, 'areas': [], 'species': []})
+
+
+# Generator of server-sent event frames for one subscriber, sends a comment line as keep-alive while idle
+def stream(areas, species):
+    get_backend()
+    subscriber = hub.subscribe(areas, species, current_app.config['EVENTS_QUEUE_SIZE'])
+    keep_alive = current_app.config['EVENTS_KEEP_ALIVE']
+    try:
+        while True:
+            if subscriber.overflowed:
+                yield 'event: resync\ndata: {}\n\n'
+                return
+            try:
+                event = subscriber.queue.get(timeout=keep_alive)
+            except queue.Empty:
+                yield ': keep-alive\n\n'
+                continue
+            yield 'event: %s\ndata: %s\n\n' % (event['type'], json.dumps(event))
+    finally:
+        hub.unsubscribe(subscriber)
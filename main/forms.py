@@ -1,11 +1,27 @@
+from datetime import datetime, time
+
 from flask_login import current_user
 from flask_wtf import FlaskForm, RecaptchaField
+from sqlalchemy import select, union_all, literal, null
 from wtforms import StringField, PasswordField, BooleanField, SubmitField, SelectField, IntegerField, \
     SelectMultipleField, FormField, widgets, TextAreaField, HiddenField
-from wtforms.validators import DataRequired, Email, EqualTo, ValidationError, Optional, Regexp
+from wtforms.fields.html5 import DateField
+from wtforms.validators import DataRequired, Email, EqualTo, ValidationError, Optional, Regexp, Length
 from wtforms.widgets import HiddenInput
 
-from main.models import Clinic, Area, FosterSpecies, PhoneNumber
+from main import db, reference
+from main.models import Clinic, PhoneNumber, ArchivedPhoneNumber, phone_key
+
+
+# Hidden version of the row an edit form was rendered with, see models.claim_version. A form posted without it gets
+# None, which never matches, instead of the version of the obj= row it was built with (that would skip the check).
+class VersionField(IntegerField):
+    widget = HiddenInput()
+
+    def process_formdata(self, valuelist):
+        if not valuelist:
+            self.data = None
+        super(VersionField, self).process_formdata(valuelist)
 
 
 class LoginForm(FlaskForm):
@@ -32,6 +48,9 @@ class PhoneForm(FlaskForm):
     def __init__(self, csrf_enabled=False, *args, **kwargs):
         super(PhoneForm, self).__init__(csrf_enabled=csrf_enabled, *args, **kwargs)
 
+    # Nested forms whose parent checks all its numbers in one query (see VolunteerForm) turn this off
+    check_registered = True
+
     # Custom validator to check dial_code + phone_number together
     def validate(self):
         valid = FlaskForm.validate(self)
@@ -48,26 +67,91 @@ class PhoneForm(FlaskForm):
             return False
         """
 
-        number = PhoneNumber.query.filter_by(dial_code=self.dial_code.data, phone_number=self.phone_number.data).first()
+        if self.check_registered:
+            return check_registered_numbers([self])
+
+        return True
+
+
+class VolunteerPhoneForm(PhoneForm):
+    check_registered = False
+
+
+class ClinicPhoneForm(PhoneForm):
+    check_registered = False
 
-        if (number is not None) and (number.clinic_id != self.clinic_id.data) and (number.volunteer_id != self.volunteer_id.data):
-            self.phone_number.errors.append('This phone number already exists in the system.')
-            return False
 
+# Checks that the numbers of the given PhoneForms aren't registered to anyone else, with a single query
+# over both the live and the archived numbers, and that no number is entered twice. Appends the errors to the
+# offending forms.
+def check_registered_numbers(phone_forms):
+    phone_forms = [(f, phone_key(f.dial_code.data, f.phone_number.data)) for f in phone_forms]
+    phone_forms = [(f, key) for f, key in phone_forms if key is not None]
+    if not phone_forms:
         return True
 
+    valid = True
+    seen = set()
+    for form, key in phone_forms:
+        if key in seen:
+            form.phone_number.errors.append('This phone number was entered twice.')
+            valid = False
+        seen.add(key)
+
+    live = PhoneNumber.__table__
+    archived = ArchivedPhoneNumber.__table__
+    keys = [key for _, key in phone_forms]
+    # Probes of the unique number indexes, so 050 and 50 are the same dial code here
+    rows = db.session.execute(union_all(
+        select([live.c.number, live.c.clinic_id, live.c.volunteer_id, literal(False).label('archived')])
+        .where(live.c.number.in_(keys)),
+        # Archived numbers stay taken, so an archived (or black-listed) volunteer can't be added again under a new id
+        select([archived.c.number, null(), archived.c.volunteer_id, literal(True).label('archived')])
+        .where(archived.c.number.in_(keys))
+    ))
+    registered = {row.number: row for row in rows}
+
+    for form, key in phone_forms:
+        number = registered.get(key)
+        if number is None:
+            continue
+        if number.archived and number.volunteer_id != form.volunteer_id.data:
+            form.phone_number.errors.append('This phone number belongs to an archived volunteer.')
+            valid = False
+        # Owned by the form's own clinic\volunteer only if that id is set, new ones have neither
+        elif not number.archived and not (number.clinic_id is not None and number.clinic_id == form.clinic_id.data) \
+                and not (number.volunteer_id is not None and number.volunteer_id == form.volunteer_id.data):
+            form.phone_number.errors.append('This phone number already exists in the system.')
+            valid = False
+    return valid
+
 
 class ClinicForm(FlaskForm):
     name = StringField('Organisation Name', validators=[DataRequired()])
     email = StringField('Email', validators=[DataRequired(), Email()])
     password = PasswordField('Password', validators=[DataRequired()])
     password2 = PasswordField('Repeat Password', validators=[DataRequired(), EqualTo('password')])
-    main_number = FormField(PhoneForm)
-    emergency_number = FormField(PhoneForm)
-    area = SelectField('Area', validators=[DataRequired()], choices=[(i.area, i.area) for i in Area.query.all()])
+    main_number = FormField(ClinicPhoneForm)
+    emergency_number = FormField(ClinicPhoneForm)
+    # Choices are set on init, so importing the forms doesn't query the db
+    area = SelectField('Area', validators=[DataRequired()])
+    # Version of the clinic the form was rendered with, checked on save
+    version = VersionField(validators=[Optional()])
     recaptcha = RecaptchaField()
     submit = SubmitField('Register')
 
+    def __init__(self, *args, **kwargs):
+        super(ClinicForm, self).__init__(*args, **kwargs)
+        self.area.choices = reference.area_choices()
+
+    # Checks both phone numbers in one query, which also catches the same number entered twice
+    def validate(self):
+        valid = FlaskForm.validate(self)
+        if not valid:
+            return False
+
+        return check_registered_numbers([self.main_number, self.emergency_number])
+
     # Called on field by default with pattern validate_<field_name>
     @staticmethod
     def validate_email(email):
@@ -79,43 +163,59 @@ class ClinicForm(FlaskForm):
 class VolunteerForm(FlaskForm):
     fname = StringField('First Name', validators=[DataRequired()])
     lname = StringField('Last Name', validators=[DataRequired()])
-    phone1 = FormField(PhoneForm)
-    phone2 = FormField(PhoneForm)
+    email = StringField('Email', validators=[Optional(), Email()])
+    phone1 = FormField(VolunteerPhoneForm)
+    phone2 = FormField(VolunteerPhoneForm)
+    # Area and species choices are set on init, so importing the forms doesn't query the db
     areas = SelectMultipleField('Area', validators=[DataRequired()],
-                                # Query all areas and converts to tuples (i.title, i.value) (here title=value)
-                                choices=[(i.area, i.area) for i in Area.query.all()],
                                 widget=widgets.ListWidget(prefix_label=False), option_widget=widgets.CheckboxInput())
     species = SelectMultipleField('Can Foster', validators=[DataRequired()],
-                                  # Query all species and converts to tuples (j.title, j.value) (here title=value)
-                                  choices=[(j.species, j.species) for j in FosterSpecies.query.all()],
                                   widget=widgets.ListWidget(prefix_label=False), option_widget=widgets.CheckboxInput())
     notes = TextAreaField('Notes')
     active = BooleanField('Active')
     black_listed = BooleanField('Black List')
+    # Version of the volunteer the form was rendered with, checked on save
+    version = VersionField(validators=[Optional()])
     submit = SubmitField('Add')
 
+    def __init__(self, *args, **kwargs):
+        super(VolunteerForm, self).__init__(*args, **kwargs)
+        self.areas.choices = reference.area_choices()
+        self.species.choices = reference.species_choices()
+
+    # Checks both phone numbers in one query, instead of one per nested form
+    def validate(self):
+        valid = FlaskForm.validate(self)
+        if not valid:
+            return False
+
+        return check_registered_numbers([self.phone1, self.phone2])
+
 
 class QueryForm(FlaskForm):
+    # Species and area choices are set on init, so importing the forms doesn't query the db
     species = SelectMultipleField('Will Foster', validators=[],
-                                  # Query all species and converts to tuples (j.title, j.value) (here title=value)
-                                  choices=[(j.species, j.species) for j in FosterSpecies.query.all()],
                                   widget=widgets.ListWidget(prefix_label=False),
                                   option_widget=widgets.CheckboxInput())
 
     areas = SelectMultipleField('Area', validators=[],
-                                # Query all areas and converts to tuples (i.title, i.value) (here title=value)
-                                choices=[(i.area, i.area) for i in Area.query.all()],
                                 widget=widgets.ListWidget(prefix_label=False),
                                 option_widget=widgets.CheckboxInput()
                                 )
     submit = SubmitField('Search')
 
+    def __init__(self, *args, **kwargs):
+        super(QueryForm, self).__init__(*args, **kwargs)
+        self.species.choices = reference.species_choices()
+        self.areas.choices = reference.area_choices()
+
 
 class SearchVolunteerForm(FlaskForm):
     fname = StringField('Fist Name')
     lname = StringField('Last Name')
     dial_code = StringField('Phone', validators=[Regexp("^[0-9]{2}$|^[0-9]{3}$", message="Not a valid dial code."), Optional()])
     phone_number = StringField('Number', validators=[Regexp("^[0-9]{7}$", message="Not a valid phone number."), Optional()])
+    include_archived = BooleanField('Include Archived')
     submit = SubmitField('Search')
 
 
@@ -127,6 +227,79 @@ class SearchClinicForm(FlaskForm):
     submit = SubmitField('Search')
 
 
+# Value of a yes\no\either select as True, False or None
+def _optional_bool(value):
+    return {'1': True, '0': False}.get(value)
+
+
+def _start_of(day):
+    return datetime.combine(day, time.min) if day else None
+
+
+class BulkVolunteerForm(FlaskForm):
+    # Filters, choices are set on init
+    areas = SelectMultipleField('In Areas', widget=widgets.ListWidget(prefix_label=False),
+                                option_widget=widgets.CheckboxInput())
+    species = SelectMultipleField('Fostering', widget=widgets.ListWidget(prefix_label=False),
+                                  option_widget=widgets.CheckboxInput())
+    contacted_after = DateField('Last Contacted From', validators=[Optional()])
+    contacted_before = DateField('Last Contacted Before', validators=[Optional()])
+    active = SelectField('Active', choices=[('', 'Any'), ('1', 'Yes'), ('0', 'No')], default='')
+    black_listed = SelectField('Black Listed', choices=[('', 'Any'), ('1', 'Yes'), ('0', 'No')], default='')
+
+    # Changes
+    set_active = SelectField('Set Active', choices=[('', 'Unchanged'), ('1', 'Yes'), ('0', 'No')], default='')
+    set_black_listed = SelectField('Set Black Listed', choices=[('', 'Unchanged'), ('1', 'Yes'), ('0', 'No')],
+                                   default='')
+    add_areas = SelectMultipleField('Add Areas', widget=widgets.ListWidget(prefix_label=False),
+                                    option_widget=widgets.CheckboxInput())
+    remove_areas = SelectMultipleField('Remove Areas', widget=widgets.ListWidget(prefix_label=False),
+                                       option_widget=widgets.CheckboxInput())
+    add_species = SelectMultipleField('Add Species', widget=widgets.ListWidget(prefix_label=False),
+                                      option_widget=widgets.CheckboxInput())
+    remove_species = SelectMultipleField('Remove Species', widget=widgets.ListWidget(prefix_label=False),
+                                         option_widget=widgets.CheckboxInput())
+
+    preview = SubmitField('Count Matching')
+    submit = SubmitField('Apply')
+
+    def __init__(self, *args, **kwargs):
+        super(BulkVolunteerForm, self).__init__(*args, **kwargs)
+        for field in (self.areas, self.add_areas, self.remove_areas):
+            field.choices = reference.area_choices()
+        for field in (self.species, self.add_species, self.remove_species):
+            field.choices = reference.species_choices()
+
+    def filters(self):
+        return {'areas': self.areas.data, 'species': self.species.data,
+                'contacted_after': _start_of(self.contacted_after.data),
+                'contacted_before': _start_of(self.contacted_before.data),
+                'active': _optional_bool(self.active.data), 'black_listed': _optional_bool(self.black_listed.data)}
+
+    def changes(self):
+        return {'active': _optional_bool(self.set_active.data),
+                'black_listed': _optional_bool(self.set_black_listed.data),
+                'add_areas': self.add_areas.data, 'remove_areas': self.remove_areas.data,
+                'add_species': self.add_species.data, 'remove_species': self.remove_species.data}
+
+
+class BroadcastForm(FlaskForm):
+    # Choices are set on init
+    areas = SelectMultipleField('In Areas', validators=[DataRequired()], widget=widgets.ListWidget(prefix_label=False),
+                                option_widget=widgets.CheckboxInput())
+    species = SelectMultipleField('Fostering', validators=[DataRequired()],
+                                  widget=widgets.ListWidget(prefix_label=False), option_widget=widgets.CheckboxInput())
+    subject = StringField('Subject', validators=[DataRequired(), Length(max=200)])
+    message = TextAreaField('Message', validators=[DataRequired(), Length(max=2000)])
+    preview = SubmitField('Count Recipients')
+    submit = SubmitField('Send')
+
+    def __init__(self, *args, **kwargs):
+        super(BroadcastForm, self).__init__(*args, **kwargs)
+        self.areas.choices = reference.area_choices()
+        self.species.choices = reference.species_choices()
+
+
 class PasswordResetRequestForm(FlaskForm):
     email = StringField('Email', validators=[DataRequired(), Email()])
     submit = SubmitField('Send Reset Email')
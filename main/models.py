@@ -1,8 +1,11 @@
+import re
 from datetime import datetime
 from time import time
 
 import jwt
 from flask_login import UserMixin
+from sqlalchemy import event, text, bindparam, select, func, literal, exists, and_
+from sqlalchemy.dialects.mysql import insert as mysql_insert
 from werkzeug.security import generate_password_hash, check_password_hash
 
 from main import db, login, app
@@ -27,6 +30,8 @@ class Clinic(UserMixin, db.Model):
     area_name = db.Column(db.String(80), db.ForeignKey('area.area'), nullable=True)
     active = db.Column(db.Boolean, default=True)
     admin = db.Column(db.Boolean, default=False)
+    # Bumped on every edit, see claim_version
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
 
     def __repr__(self):
         return '<Clinic %r>' % self.name
@@ -61,7 +66,10 @@ class Volunteer(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     fname = db.Column(db.String(80))
     lname = db.Column(db.String(100))
-    phone_numbers = db.relationship('PhoneNumber', lazy='subquery', backref=db.backref('volunteer', lazy=True))
+    # Optional, foster request broadcasts are emailed to it (see main.broadcast)
+    email = db.Column(db.String(120), nullable=True)
+    # Loaded on access, the volunteer cards don't show phone numbers (see volunteer_contact)
+    phone_numbers = db.relationship('PhoneNumber', lazy=True, backref=db.backref('volunteer', lazy=True))
     areas = db.relationship('Area', secondary=areas_volunteers, lazy='subquery',
                             backref=db.backref('volunteers', lazy=True))
     species = db.relationship('FosterSpecies', secondary=volunteers_species, lazy='subquery',
@@ -70,14 +78,95 @@ class Volunteer(db.Model):
     active = db.Column(db.Boolean, default=True)
     black_listed = db.Column(db.Boolean, default=False)
     notes = db.Column(db.String(500), nullable=True)
+    # Bumped on every edit, see claim_version
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
 
     def __repr__(self):
         return '<Volunteer %r>' % self.fname+' '+self.lname
 
 
+# Optimistic concurrency check for edit forms. Bumps the version of the row only if it is still the version the form
+# was rendered with, returns False if someone else saved in between. No lock is held between GET and POST, and the
+# row stays locked by this UPDATE until commit, so the rest of the edit can't be overwritten either.
+def claim_version(model, id, version):
+    return db.session.query(model)\
+        .filter(model.id == id, model.version == version)\
+        .update({model.version: model.version + 1}, synchronize_session=False) == 1
+
+
+# Per-clinic rotation position, replaces Volunteer.last_contacted in queue order when PER_CLINIC_ROTATION is set.
+# Every clinic has a row for every volunteer, starting at the volunteer's shared last_contacted (see
+# fill_clinic_contacts), so a clinic's queue is a single range scan of the (clinic_id, last_contacted, volunteer_id)
+# index, see queries.queue_slice.
+class ClinicContact(db.Model):
+    clinic_id = db.Column(db.Integer, db.ForeignKey('clinic.id'), primary_key=True)
+    volunteer_id = db.Column(db.Integer, db.ForeignKey('volunteer.id'), primary_key=True)
+    last_contacted = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (db.Index('ix_clinic_contact_rotation', 'clinic_id', 'last_contacted', 'volunteer_id'),)
+
+    def __repr__(self):
+        return '<ClinicContact %r-%r>' % (self.clinic_id, self.volunteer_id)
+
+
+# Adds the missing clinic_contact rows of the clinic, or of the volunteers, or all of them. Runs on whatever
+# executes it (session or connection).
+def fill_clinic_contacts(executor, clinic_id=None, volunteer_ids=None):
+    clinic = Clinic.__table__
+    volunteer = Volunteer.__table__
+    clinic_contact = ClinicContact.__table__
+    pairs = select([clinic.c.id, volunteer.c.id,
+                    func.coalesce(volunteer.c.last_contacted, literal(datetime.utcnow(), db.DateTime))])\
+        .where(~exists().where(and_(clinic_contact.c.clinic_id == clinic.c.id,
+                                    clinic_contact.c.volunteer_id == volunteer.c.id)))
+    if clinic_id is not None:
+        pairs = pairs.where(clinic.c.id == clinic_id)
+    if volunteer_ids is not None:
+        pairs = pairs.where(volunteer.c.id.in_(volunteer_ids))
+    executor.execute(clinic_contact.insert().from_select(['clinic_id', 'volunteer_id', 'last_contacted'], pairs))
+
+
+@event.listens_for(Clinic, 'after_insert')
+def _add_clinic_contacts(mapper, connection, target):
+    fill_clinic_contacts(connection, clinic_id=target.id)
+
+
+@event.listens_for(Volunteer, 'after_insert')
+def _add_volunteer_contacts(mapper, connection, target):
+    fill_clinic_contacts(connection, volunteer_ids=[target.id])
+
+
+# Sets the clinic's last contact with the volunteer in one upsert, so concurrent cycles of the same pair
+# don't race each other into a duplicate key
+def touch_clinic_contact(clinic_id, volunteer_id, when):
+    values = dict(clinic_id=clinic_id, volunteer_id=volunteer_id, last_contacted=when)
+    if db.session.bind.dialect.name == 'mysql':
+        stmt = mysql_insert(ClinicContact.__table__).values(**values)
+        db.session.execute(stmt.on_duplicate_key_update(last_contacted=stmt.inserted.last_contacted))
+        return
+
+    db.session.execute(text('INSERT INTO clinic_contact (clinic_id, volunteer_id, last_contacted) '
+                            'VALUES (:clinic_id, :volunteer_id, :last_contacted) '
+                            'ON CONFLICT (clinic_id, volunteer_id) DO UPDATE SET last_contacted = excluded.last_contacted')
+                       .bindparams(bindparam('last_contacted', type_=db.DateTime)), values)
+
+
+# Canonical form of a phone number, the digits of dial code and number as one integer, so "050" and "50" or
+# formatting don't make two numbers out of one (050-1234567 -> 501234567). None unless both parts have digits.
+# Numbers are always 7 digits, so the key still tells the dial code and number apart.
+def phone_key(dial_code, phone_number):
+    dial_code = re.sub(r'\D', '', dial_code or '')
+    phone_number = re.sub(r'\D', '', phone_number or '')
+    if not dial_code or not phone_number:
+        return None
+    return int(dial_code + phone_number)
+
+
 class PhoneNumber(db.Model):
     dial_code = db.Column(db.String(3), primary_key=True)
     phone_number = db.Column(db.String(7), primary_key=True)
+    # phone_key of the above, set on every insert\update. All lookups by number go through its unique index.
+    number = db.Column(db.BigInteger, index=True, unique=True)
     primary_contact = db.Column(db.Boolean, default=False)
     # Foreignkey to connect to either Clinic or Volunteer as ManyToOne
     clinic_id = db.Column(db.Integer, db.ForeignKey('clinic.id'), nullable=True)
@@ -102,6 +191,124 @@ class PhoneNumber(db.Model):
         self.volunteer_id = new_data.volunteer_id
 
 
+# Archive tier, see main.archive. Long inactive and black-listed volunteers are moved here (same ids) with their
+# phones and associations, so the tables the rotation queue reads only hold the working roster.
+archived_areas_volunteers = db.Table('archived_areas_vs_volunteers',
+                                     db.Column('area', db.String(80), db.ForeignKey('area.area'), primary_key=True),
+                                     db.Column('vol_id', db.Integer, db.ForeignKey('archived_volunteer.id'), primary_key=True))
+
+
+archived_volunteers_species = db.Table('archived_volunteers_vs_species',
+                                       db.Column('vol_id', db.Integer, db.ForeignKey('archived_volunteer.id'), primary_key=True),
+                                       db.Column('foster_species', db.String(20), db.ForeignKey('foster_species.species'), primary_key=True))
+
+
+class ArchivedVolunteer(db.Model):
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    fname = db.Column(db.String(80))
+    lname = db.Column(db.String(100))
+    email = db.Column(db.String(120), nullable=True)
+    phone_numbers = db.relationship('ArchivedPhoneNumber', lazy='subquery')
+    areas = db.relationship('Area', secondary=archived_areas_volunteers, lazy='subquery')
+    species = db.relationship('FosterSpecies', secondary=archived_volunteers_species, lazy='subquery')
+    last_contacted = db.Column(db.DateTime)
+    active = db.Column(db.Boolean)
+    black_listed = db.Column(db.Boolean)
+    notes = db.Column(db.String(500), nullable=True)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    archived_at = db.Column(db.DateTime, index=True, default=datetime.utcnow)
+
+    def __repr__(self):
+        return '<ArchivedVolunteer %r>' % self.fname+' '+self.lname
+
+
+class ArchivedPhoneNumber(db.Model):
+    dial_code = db.Column(db.String(3), primary_key=True)
+    phone_number = db.Column(db.String(7), primary_key=True)
+    number = db.Column(db.BigInteger, index=True, unique=True)
+    primary_contact = db.Column(db.Boolean, default=False)
+    volunteer_id = db.Column(db.Integer, db.ForeignKey('archived_volunteer.id'), index=True)
+
+    def __repr__(self):
+        return str(self.dial_code) + "-" + str(self.phone_number)
+
+
+@event.listens_for(PhoneNumber, 'before_insert')
+@event.listens_for(PhoneNumber, 'before_update')
+@event.listens_for(ArchivedPhoneNumber, 'before_insert')
+@event.listens_for(ArchivedPhoneNumber, 'before_update')
+def _set_phone_key(mapper, connection, target):
+    target.number = phone_key(target.dial_code, target.phone_number)
+
+
+# Roster statistics, maintained incrementally by main.stats and rebuilt by its reconcile job.
+# Active, non black-listed volunteers per area x species
+class RosterCount(db.Model):
+    area = db.Column(db.String(80), db.ForeignKey('area.area'), primary_key=True)
+    species = db.Column(db.String(20), db.ForeignKey('foster_species.species'), primary_key=True)
+    volunteers = db.Column(db.Integer, nullable=False, default=0)
+
+
+# Active, non black-listed volunteers by the day they were last contacted, read as an age histogram
+class LastContactedCount(db.Model):
+    day = db.Column(db.Date, primary_key=True)
+    volunteers = db.Column(db.Integer, nullable=False, default=0)
+
+
+# Volunteers cycled by each clinic per day
+class DailyContactCount(db.Model):
+    clinic_id = db.Column(db.Integer, db.ForeignKey('clinic.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    contacts = db.Column(db.Integer, nullable=False, default=0)
+
+
+# Checkpoints of data backfills run by migrations (main.backfill), so an interrupted backfill resumes where it stopped
+class BackfillProgress(db.Model):
+    name = db.Column(db.String(120), primary_key=True)
+    last_id = db.Column(db.Integer, nullable=False, default=0)
+    rows = db.Column(db.Integer, nullable=False, default=0)
+    finished = db.Column(db.Boolean, nullable=False, default=False)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+# Foster request broadcasts (main.broadcast). A recipient row is written per matching volunteer when the broadcast
+# is created, with the address it goes to, and marked sent\failed as it is sent, so a broadcast interrupted half way
+# can be resumed. volunteer_id has no foreign key, recipients are kept when their volunteer is archived.
+class Broadcast(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    clinic_id = db.Column(db.Integer, db.ForeignKey('clinic.id'), nullable=False)
+    subject = db.Column(db.String(200), nullable=False)
+    message = db.Column(db.String(2000), nullable=False)
+    # Comma separated, as chosen on the form
+    areas = db.Column(db.String(500))
+    species = db.Column(db.String(200))
+    created_at = db.Column(db.DateTime, index=True, nullable=False, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    clinic = db.relationship('Clinic', lazy=True)
+
+    def __repr__(self):
+        return '<Broadcast %r>' % self.id
+
+
+class BroadcastRecipient(db.Model):
+    broadcast_id = db.Column(db.Integer, db.ForeignKey('broadcast.id'), primary_key=True)
+    volunteer_id = db.Column(db.Integer, primary_key=True)
+    email = db.Column(db.String(120), nullable=False)
+    # pending, sent or failed
+    status = db.Column(db.String(10), nullable=False, default='pending')
+    error = db.Column(db.String(200), nullable=True)
+    sent_at = db.Column(db.DateTime, nullable=True)
+    # Set by the sender about to mail this recipient, see broadcast._claim
+    claimed_at = db.Column(db.DateTime, nullable=True)
+    claimed_by = db.Column(db.String(32), nullable=True)
+
+    # Senders read the pending recipients of a broadcast in volunteer_id order, one batch at a time
+    __table_args__ = (db.Index('ix_broadcast_recipient_status', 'broadcast_id', 'status', 'volunteer_id'),)
+
+    def __repr__(self):
+        return '<BroadcastRecipient %r-%r>' % (self.broadcast_id, self.volunteer_id)
+
+
 class Area(db.Model):
     area = db.Column(db.String(80), primary_key=True)
     # OneToMany connection with Clinic. Connection with Volunteer is ManyToMany and defined with helper table
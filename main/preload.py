@@ -0,0 +1,32 @@
+import gc
+
+from main import app, db, reference, assets, rotation
+
+# Hooks for running under a prefork server with the app preloaded in the master (see gunicorn.conf.py).
+# The master warms everything that is read-only after startup, closes its db connections and freezes the heap,
+# so workers share those pages copy-on-write instead of each building (and dirtying) their own copy.
+
+
+def warm():
+    with app.app_context():
+        # Reference data used by every form and by index
+        reference.areas()
+        reference.species()
+        # Fingerprinted and precompressed static files
+        assets.manifest()
+        # Compiles every template into the jinja cache
+        for name in app.jinja_env.list_templates():
+            app.jinja_env.get_template(name)
+        # Connections opened while warming must not be inherited by the workers
+        db.session.remove()
+        db.engine.dispose()
+    # Moves everything allocated so far out of the collector's reach, so collections in the workers
+    # don't touch (and copy) the shared pages
+    gc.freeze()
+
+
+# Every worker starts with an empty pool of its own, even if the master opened connections after warm().
+# The rotation index is built per worker, its event listener must run in the worker.
+def after_fork():
+    db.engine.dispose()
+    rotation.start()
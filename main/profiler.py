@@ -0,0 +1,173 @@
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from datetime import datetime
+
+from flask import g, request, has_request_context
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from main import app
+
+# On-demand request profiler. A request is captured when an admin asks for it (?profile=1 or an X-Profile header)
+# or, for any request, with probability PROFILE_SAMPLE_RATE. While the request runs a thread samples its stack every
+# PROFILE_INTERVAL_MS, and every SQL statement it executes is timed. Captures are written as json to PROFILE_DIR,
+# keeping the newest PROFILE_KEEP, and listed for admins on /admin/profiles. Stacks are downloaded in the collapsed
+# format ("frame;frame;frame count" per line) read by flamegraph.pl and speedscope.
+
+# Endpoints never captured: the profiler's own pages, static files, and the long-lived events stream
+SKIPPED_ENDPOINTS = ('static', 'volunteer_events', 'profiles', 'download_profile')
+
+_write_lock = threading.Lock()
+
+
+class Sampler(threading.Thread):
+    def __init__(self, thread_id, interval):
+        super(Sampler, self).__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = {}
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('%s (%s:%d)' % (code.co_name, _short_path(code.co_filename), code.co_firstlineno))
+                frame = frame.f_back
+            # Stored root first
+            key = ';'.join(reversed(stack))
+            self.stacks[key] = self.stacks.get(key, 0) + 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def _short_path(filename):
+    for prefix in sorted(sys.path, key=len, reverse=True):
+        if prefix and filename.startswith(prefix + os.sep):
+            return filename[len(prefix) + 1:]
+    return filename
+
+
+def _requested():
+    if request.args.get('profile') or request.headers.get('X-Profile'):
+        return current_user.is_authenticated and current_user.admin
+    rate = app.config['PROFILE_SAMPLE_RATE']
+    return rate > 0 and random.random() < rate
+
+
+@app.before_request
+def start_profile():
+    if request.endpoint in SKIPPED_ENDPOINTS or not _requested():
+        return
+    sampler = Sampler(threading.get_ident(), app.config['PROFILE_INTERVAL_MS'] / 1000.0)
+    g.profile = {'sampler': sampler, 'sql': [], 'started': time.perf_counter()}
+    sampler.start()
+
+
+@app.after_request
+def finish_profile(response):
+    capture = g.pop('profile', None)
+    if capture is None:
+        return response
+    duration = time.perf_counter() - capture['started']
+    capture['sampler'].stop()
+
+    _save({
+        'time': datetime.utcnow().isoformat(),
+        'method': request.method,
+        'path': request.full_path.rstrip('?'),
+        'endpoint': request.endpoint,
+        'status': response.status_code,
+        'duration_ms': round(duration * 1000, 2),
+        'interval_ms': app.config['PROFILE_INTERVAL_MS'],
+        'samples': capture['sampler'].samples,
+        'stacks': capture['sampler'].stacks,
+        'sql': capture['sql'],
+    })
+    return response
+
+
+# Requests that raised never reach after_request, their sampler is just stopped
+@app.teardown_request
+def discard_profile(exc):
+    capture = g.pop('profile', None)
+    if capture is not None:
+        capture['sampler'].stop()
+
+
+# SQL timings, only collected on the thread of a request being profiled
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'profile' in g:
+        conn.info.setdefault('profile_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'profile' in g and conn.info.get('profile_started'):
+        duration = time.perf_counter() - conn.info['profile_started'].pop()
+        g.profile['sql'].append({'statement': statement, 'duration_ms': round(duration * 1000, 3)})
+
+
+def _save(capture):
+    directory = app.config['PROFILE_DIR']
+    name = '%s-%s.json' % (datetime.utcnow().strftime('%Y%m%d%H%M%S%f'), capture['endpoint'] or 'unknown')
+    with _write_lock:
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, name), 'w') as f:
+            json.dump(capture, f)
+        # Oldest captures go first, names start with the capture time
+        for old in _names()[app.config['PROFILE_KEEP']:]:
+            os.remove(os.path.join(directory, old))
+
+
+# Capture file names, newest first
+def _names():
+    directory = app.config['PROFILE_DIR']
+    if not os.path.isdir(directory):
+        return []
+    return sorted((name for name in os.listdir(directory) if name.endswith('.json')), reverse=True)
+
+
+def load(name):
+    # Names come from the url, only plain capture names are read
+    if not re.match(r'^[\w-]+\.json$', name):
+        return None
+    path = os.path.join(app.config['PROFILE_DIR'], name)
+    if not os.path.isfile(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+# Summaries for the admin list
+def captures():
+    results = []
+    for name in _names():
+        capture = load(name)
+        if capture is None:
+            continue
+        results.append({'name': name, 'time': capture['time'], 'method': capture['method'],
+                        'path': capture['path'], 'status': capture['status'],
+                        'duration_ms': capture['duration_ms'], 'samples': capture['samples'],
+                        'queries': len(capture['sql']),
+                        'sql_ms': round(sum(q['duration_ms'] for q in capture['sql']), 2)})
+    return results
+
+
+def collapsed(capture):
+    return ''.join('%s %d\n' % (stack, count) for stack, count in sorted(capture['stacks'].items()))
@@ -0,0 +1,71 @@
+from sqlalchemy import select, and_, or_, exists
+
+from main.models import Volunteer, ClinicContact, PhoneNumber, areas_volunteers, volunteers_species, phone_key
+
+# Core statements for the read-heavy paths, shared by the sync JSON routes and the async ASGI handlers (main.asgi)
+# so both serving modes return the same results. Empty areas\species means no filter on that field.
+
+volunteer = Volunteer.__table__
+clinic_contact = ClinicContact.__table__
+phone_number = PhoneNumber.__table__
+
+PAGE_SIZE = 10
+
+
+def _queue_conditions(areas, species):
+    conditions = [volunteer.c.active, volunteer.c.black_listed.is_(False)]
+    # EXISTS instead of joining both association tables, so no DISTINCT is needed
+    if areas:
+        conditions.append(exists().where(and_(areas_volunteers.c.vol_id == volunteer.c.id,
+                                              areas_volunteers.c.area.in_(areas))))
+    if species:
+        conditions.append(exists().where(and_(volunteers_species.c.vol_id == volunteer.c.id,
+                                              volunteers_species.c.foster_species.in_(species))))
+    return conditions
+
+
+def queue_slice(areas, species, clinic_id, offset, limit):
+    columns = [volunteer.c.id, volunteer.c.fname, volunteer.c.lname, volunteer.c.last_contacted]
+    conditions = _queue_conditions(areas, species)
+    if clinic_id is None:
+        return select(columns).where(and_(*conditions))\
+            .order_by(volunteer.c.last_contacted).limit(limit).offset(offset)
+
+    # Per-clinic order, a range scan of ix_clinic_contact_rotation (the clinic has a row for every volunteer)
+    return select(columns)\
+        .select_from(clinic_contact.join(volunteer, volunteer.c.id == clinic_contact.c.volunteer_id))\
+        .where(and_(clinic_contact.c.clinic_id == clinic_id, *conditions))\
+        .order_by(clinic_contact.c.last_contacted, clinic_contact.c.volunteer_id).limit(limit).offset(offset)
+
+
+def rotation_queue(areas, species, clinic_id=None, page=1, per_page=PAGE_SIZE):
+    return queue_slice(areas, species, clinic_id, (page - 1) * per_page, per_page)
+
+
+def volunteers_by_phone(dial_code, phone, page=1, per_page=PAGE_SIZE):
+    return select([volunteer.c.id, volunteer.c.fname, volunteer.c.lname, volunteer.c.last_contacted])\
+        .where(exists().where(and_(phone_number.c.volunteer_id == volunteer.c.id,
+                                   phone_number.c.number == phone_key(dial_code, phone))))\
+        .order_by(volunteer.c.id).limit(per_page).offset((page - 1) * per_page)
+
+
+# Matches both names if both are given, otherwise either
+def volunteers_by_name(fname, lname, page=1, per_page=PAGE_SIZE):
+    if fname and lname:
+        condition = and_(volunteer.c.fname.ilike(fname), volunteer.c.lname.ilike(lname))
+    else:
+        condition = or_(volunteer.c.fname.ilike(fname), volunteer.c.lname.ilike(lname))
+    return select([volunteer.c.id, volunteer.c.fname, volunteer.c.lname, volunteer.c.last_contacted])\
+        .where(condition)\
+        .order_by(volunteer.c.id).limit(per_page).offset((page - 1) * per_page)
+
+
+# Rows come back as RowProxy from the sync session and Record from the async driver, both support dict()
+def serialize(rows):
+    results = []
+    for row in rows:
+        row = dict(row)
+        if row.get('last_contacted') is not None:
+            row['last_contacted'] = row['last_contacted'].isoformat()
+        results.append(row)
+    return results
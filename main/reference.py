@@ -0,0 +1,38 @@
+from main.models import Area, FosterSpecies
+
+# Areas and species change only through the shell or migrations, so they are loaded once per process
+# instead of on every form and page. Loaded lazily (never at import) so importing the app does no DB I/O.
+# With the preload mode (gunicorn.conf.py) they are warmed in the master and shared with the workers.
+
+_areas = None
+_species = None
+
+
+def areas():
+    global _areas
+    if _areas is None:
+        _areas = tuple(a.area for a in Area.query.order_by(Area.area))
+    return _areas
+
+
+def species():
+    global _species
+    if _species is None:
+        _species = tuple(s.species for s in FosterSpecies.query.order_by(FosterSpecies.species))
+    return _species
+
+
+# Converts to tuples (i.title, i.value) for SelectField choices (here title=value)
+def area_choices():
+    return [(a, a) for a in areas()]
+
+
+def species_choices():
+    return [(s, s) for s in species()]
+
+
+# Drops the cached values, e.g. after adding an area from the shell
+def reload():
+    global _areas, _species
+    _areas = None
+    _species = None
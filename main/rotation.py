@@ -0,0 +1,199 @@
+import heapq
+import threading
+import time
+
+from sqlalchemy import select
+
+from main import app, db, events
+from main.models import Volunteer, areas_volunteers, volunteers_species
+
+# Optional in-process rotation index (ROTATION_INDEX). Answers "who is next" for index without going to the db:
+# one heap of (last_contacted, volunteer id) per (area, species) for the active, non black-listed volunteers,
+# and multi area\species queries are an n-way merge of the matching heaps.
+# The db stays the source of truth. Volunteers named in events (cycled\edited\added, from any worker when the redis
+# events backend is used) are reloaded before the next query, and the whole index is checked against the db
+# every ROTATION_INDEX_CHECK_SECONDS. With the local backend other workers' changes are only seen by that check,
+# so a warning is logged when the index starts without redis.
+# Built when a worker starts (start(), called from main.preload and the ASGI lifespan), or by the first query
+# otherwise. Not used with PER_CLINIC_ROTATION, where every clinic has its own order.
+#
+# Heaps are lists of (last_contacted timestamp, id) tuples rather than arrays: heapq's C functions only work on
+# lists, sifting an array.array heap would run in Python. Per volunteer state is a __slots__ object.
+
+volunteer = Volunteer.__table__
+
+
+class _State(object):
+    __slots__ = ('last_contacted', 'keys')
+
+    def __init__(self, last_contacted, keys):
+        self.last_contacted = last_contacted
+        self.keys = keys
+
+
+# Loads {volunteer id: _State} for the rotation, for all volunteers or only the given ids
+def _load_states(ids=None):
+    rows = select([volunteer.c.id, volunteer.c.last_contacted])\
+        .where(volunteer.c.active.is_(True))\
+        .where(volunteer.c.black_listed.is_(False))
+    vol_areas = select([areas_volunteers.c.vol_id, areas_volunteers.c.area])
+    vol_species = select([volunteers_species.c.vol_id, volunteers_species.c.foster_species])
+    if ids is not None:
+        rows = rows.where(volunteer.c.id.in_(ids))
+        vol_areas = vol_areas.where(areas_volunteers.c.vol_id.in_(ids))
+        vol_species = vol_species.where(volunteers_species.c.vol_id.in_(ids))
+
+    last_contacted = {row.id: row.last_contacted.timestamp() if row.last_contacted else 0.0
+                      for row in db.session.execute(rows)}
+    areas = {}
+    for vol_id, area in db.session.execute(vol_areas):
+        if vol_id in last_contacted:
+            areas.setdefault(vol_id, []).append(area)
+    species = {}
+    for vol_id, s in db.session.execute(vol_species):
+        if vol_id in last_contacted:
+            species.setdefault(vol_id, []).append(s)
+
+    return {vol_id: _State(ts, frozenset((a, s) for a in areas.get(vol_id, ()) for s in species.get(vol_id, ())))
+            for vol_id, ts in last_contacted.items()}
+
+
+class RotationIndex(object):
+    def __init__(self):
+        self._states = {}
+        self._heaps = {}
+        # Heap entries left behind by updates, skipped when read and dropped when the heaps are compacted
+        self._stale = 0
+        self._entries = 0
+        self._dirty = set()
+        self._lock = threading.RLock()
+        self._check_lock = threading.Lock()
+        self._checked_at = None
+
+    def _put(self, vol_id, state):
+        self._states[vol_id] = state
+        for key in state.keys:
+            heapq.heappush(self._heaps.setdefault(key, []), (state.last_contacted, vol_id))
+        self._entries += len(state.keys)
+
+    def _remove(self, vol_id):
+        state = self._states.pop(vol_id, None)
+        if state is not None:
+            self._stale += len(state.keys)
+
+    def _replace(self, states):
+        self._states = {}
+        self._heaps = {}
+        self._stale = 0
+        self._entries = 0
+        for vol_id, state in states.items():
+            self._put(vol_id, state)
+
+    def _compact(self):
+        if self._stale > self._entries - self._stale:
+            self._replace(self._states)
+
+    def _on_event(self, event):
+        if event.get('volunteer_id') is None:
+            return
+        with self._lock:
+            self._dirty.add(event['volunteer_id'])
+
+    def _refresh_dirty(self):
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        if not dirty:
+            return
+        states = _load_states(dirty)
+        with self._lock:
+            for vol_id in dirty:
+                self._remove(vol_id)
+                if vol_id in states:
+                    self._put(vol_id, states[vol_id])
+            self._compact()
+
+    def _due(self):
+        return self._checked_at is None or \
+            time.monotonic() - self._checked_at > app.config['ROTATION_INDEX_CHECK_SECONDS']
+
+    # Rebuilds from the db on first use and then every ROTATION_INDEX_CHECK_SECONDS, logging any drift found.
+    # Only one request does the check, the others keep answering from the current index meanwhile.
+    def _check(self):
+        first = self._checked_at is None
+        if not self._due() or not self._check_lock.acquire(blocking=first):
+            return
+        try:
+            if not self._due():
+                return
+            if first:
+                if app.config['EVENTS_BACKEND'] != 'redis':
+                    app.logger.warning('Rotation index started with the %r events backend, changes made by other '
+                                       'workers are only seen every %d seconds. Use EVENTS_BACKEND=redis with '
+                                       'several workers.', app.config['EVENTS_BACKEND'],
+                                       app.config['ROTATION_INDEX_CHECK_SECONDS'])
+                # Started here rather than at import so the redis listener only runs in workers
+                events.hub.add_listener(self._on_event)
+                events.get_backend()
+            states = _load_states()
+            with self._lock:
+                if not first:
+                    drift = set(states).symmetric_difference(self._states)
+                    drift.update(vol_id for vol_id, state in states.items() if vol_id in self._states and
+                                 (self._states[vol_id].last_contacted != state.last_contacted or
+                                  self._states[vol_id].keys != state.keys))
+                    if drift:
+                        app.logger.warning('Rotation index was out of date for %d volunteers', len(drift))
+                self._replace(states)
+                self._checked_at = time.monotonic()
+        finally:
+            self._check_lock.release()
+
+    # Loads the whole index now instead of on the first query
+    def build(self):
+        self._check()
+
+    # Makes the next query check the whole index against the db, after changes that sent no events (bulk changes)
+    def expire(self):
+        if self._checked_at is not None:
+            self._checked_at = float('-inf')
+
+    # Ids of the first n volunteers in rotation order that foster any of species in any of areas
+    def next_volunteers(self, areas, species, n):
+        self._check()
+        self._refresh_dirty()
+
+        with self._lock:
+            keys = [(a, s) for a in areas for s in species if (a, s) in self._heaps]
+            heaps = [self._heaps[key] for key in keys]
+            # Walks all the matching heaps in order without popping them: starts from every root and
+            # pushes the children of each entry taken
+            frontier = [(heap[0], i, 0) for i, heap in enumerate(heaps) if heap]
+            heapq.heapify(frontier)
+            result = []
+            seen = set()
+            while frontier and len(result) < n:
+                entry, i, pos = heapq.heappop(frontier)
+                heap = heaps[i]
+                for child in (2 * pos + 1, 2 * pos + 2):
+                    if child < len(heap):
+                        heapq.heappush(frontier, (heap[child], i, child))
+
+                last_contacted, vol_id = entry
+                state = self._states.get(vol_id)
+                if state is None or state.last_contacted != last_contacted or keys[i] not in state.keys \
+                        or vol_id in seen:
+                    continue
+                seen.add(vol_id)
+                result.append(vol_id)
+            return result
+
+
+index = RotationIndex()
+
+
+# Builds the index of this worker, when enabled
+def start():
+    if app.config['ROTATION_INDEX'] and not app.config['PER_CLINIC_ROTATION']:
+        with app.app_context():
+            index.build()
+            db.session.remove()
@@ -6,12 +6,15 @@ from werkzeug.urls import url_parse
 from werkzeug.utils import redirect
 
 from main import app, db
-from flask import render_template, flash, url_for, request
+from flask import render_template, flash, url_for, request, Response, stream_with_context, jsonify, abort
 
+from main import events, queries, reference, archive, stats, rotation, profiler, bulk, search_cache, broadcast
 from main.email import send_password_reset_email
 from main.forms import LoginForm, ClinicForm, VolunteerForm, QueryForm, SearchVolunteerForm, SearchClinicForm, \
-    PasswordResetRequestForm, PasswordResetForm
-from main.models import Clinic, Area, Volunteer, PhoneNumber, FosterSpecies
+    PasswordResetRequestForm, PasswordResetForm, BulkVolunteerForm, BroadcastForm
+from main.models import Clinic, Area, Volunteer, PhoneNumber, FosterSpecies, ArchivedVolunteer, \
+    ArchivedPhoneNumber, Broadcast, areas_volunteers, volunteers_species, claim_version, phone_key, \
+    touch_clinic_contact, fill_clinic_contacts
 
 
 @app.route('/', methods=['GET', 'POST'])
@@ -25,7 +28,8 @@ def index():
     # Calls the search function when form is submitted
     if search_form.validate_on_submit() and search_form.data:
         return search_volunteers(search_form.fname.data, search_form.lname.data,
-                                 search_form.dial_code.data, search_form.phone_number.data)
+                                 search_form.dial_code.data, search_form.phone_number.data,
+                                 search_form.include_archived.data)
 
     if param_form.validate_on_submit():
         # Resets page on search
@@ -46,7 +50,7 @@ def index():
     else:
         # Called when passing empty form
         # Initializes species args for query.filter to all species as default
-        vol_species = [s.species for s in FosterSpecies.query.all()]
+        vol_species = list(reference.species())
 
     if param_form.is_submitted() and param_form.areas.data:
         # Called when submitting search form
@@ -60,9 +64,36 @@ def index():
     else:
         # Called when passing empty form
         # Initializes areas args for query.filter to clinic area as default
-        vol_areas = current_user.area_name if current_user.area_name else [a.area for a in Area.query.all()]
+        vol_areas = [current_user.area_name] if current_user.area_name else list(reference.areas())
         param_form.areas.data = vol_areas
 
+    if app.config['ROTATION_INDEX'] and not app.config['PER_CLINIC_ROTATION']:
+        # Order comes from the in-memory rotation index, only the volunteer shown is loaded from the db
+        ids = rotation.index.next_volunteers(vol_areas, vol_species, page + 1)
+        shown = Volunteer.query.get(ids[page - 1]) if len(ids) >= page else None
+        volunteers = [shown] if shown else []
+        has_next = len(ids) > page
+    else:
+        volunteers, has_next = rotation_queue_page(vol_areas, vol_species, page)
+
+    next_url = url_for('index', page=page + 1, species=param_form.species.data, areas=param_form.areas.data)\
+        if has_next else None
+    prev_url = url_for('index', page=page - 1, species=param_form.species.data, areas=param_form.areas.data)\
+        if page > 1 else None
+    events_url = url_for('volunteer_events', species=vol_species, areas=vol_areas)
+    return render_template('index.html', param_form=param_form, search_form=search_form, title="Made It",
+                           volunteers=volunteers, next_url=next_url, prev_url=prev_url, events_url=events_url)
+
+
+# Returns the page-th volunteer of the rotation queue (as a list) and whether there is a next one
+def rotation_queue_page(vol_areas, vol_species, page):
+    if app.config['PER_CLINIC_ROTATION']:
+        # Orders by this clinic's own contact times, reading the page's volunteer and the one after it
+        rows = db.session.execute(queries.queue_slice(vol_areas, vol_species, current_user.id, page - 1, 2))\
+            .fetchall()
+        shown = Volunteer.query.get(rows[0].id) if rows else None
+        return [shown] if shown else [], len(rows) > 1
+
     volunteers = Volunteer.query\
         .join(Volunteer.species)\
         .join(Volunteer.areas)\
@@ -73,13 +104,48 @@ def index():
         .distinct()\
         .order_by(Volunteer.last_contacted)\
         .paginate(page, 1, False)
+    return volunteers.items, volunteers.has_next
 
-    next_url = url_for('index', page=volunteers.next_num, species=param_form.species.data, areas=param_form.areas.data)\
-        if volunteers.has_next else None
-    prev_url = url_for('index', page=volunteers.prev_num, species=param_form.species.data, areas=param_form.areas.data)\
-        if volunteers.has_prev else None
-    return render_template('index.html', param_form=param_form, search_form=search_form, title="Made It",
-                           volunteers=volunteers.items, next_url=next_url, prev_url=prev_url)
+
+# Server-sent events stream of volunteers being cycled\edited\deactivated, filtered by areas and species
+@app.route('/events')
+@login_required
+def volunteer_events():
+    vol_species = request.args.getlist('species') or reference.species()
+    vol_areas = request.args.getlist('areas') or reference.areas()
+    # Ends the request's session before streaming so the connection isn't held for the lifetime of the stream
+    db.session.remove()
+    return Response(stream_with_context(events.stream(vol_areas, vol_species)), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+# JSON read paths. main.asgi serves the same paths with the async driver when running under an ASGI server.
+@app.route('/api/queue')
+@login_required
+def api_queue():
+    vol_areas = request.args.getlist('areas') or ([current_user.area_name] if current_user.area_name else [])
+    clinic_id = current_user.id if app.config['PER_CLINIC_ROTATION'] else None
+    rows = db.session.execute(queries.rotation_queue(vol_areas, request.args.getlist('species'), clinic_id,
+                                                     request.args.get('page', 1, type=int)))
+    return jsonify(volunteers=queries.serialize(rows))
+
+
+@app.route('/api/search')
+@login_required
+def api_search():
+    page = request.args.get('page', 1, type=int)
+    dial_code = request.args.get('dial_code')
+    phone_num = request.args.get('phone_number')
+    fname = request.args.get('fname')
+    lname = request.args.get('lname')
+
+    # Same precedence as search_volunteers, phone first and names if the phone is not provided or not found
+    results = []
+    if dial_code and phone_num:
+        results = queries.serialize(db.session.execute(queries.volunteers_by_phone(dial_code, phone_num, page)))
+    if not results and (fname or lname):
+        results = queries.serialize(db.session.execute(queries.volunteers_by_name(fname, lname, page)))
+    return jsonify(volunteers=results)
 
 
 @app.route('/login', methods=['GET', 'POST'])
@@ -98,6 +164,11 @@ def login():
             flash('Invalid email or password')
             return redirect(url_for('login'))
 
+        # Adds the rotation rows of any volunteer created while the clinic registered, which neither insert saw.
+        if app.config['PER_CLINIC_ROTATION']:
+            fill_clinic_contacts(db.session, clinic_id=clinic.id)
+            db.session.commit()
+
         # If everything checks out, log the user in (saves details to current_user).
         login_user(clinic, remember=form_to_render.remember_me.data)
         next_page = request.args.get('next')
@@ -122,10 +193,6 @@ def register():
         return redirect(url_for('index'))
 
     form = ClinicForm()
-    # Generate raw list of all areas to choose)
-    choices = Area.query.all()
-    # Turns choices into tuples (i.title, i.value) (title and value identical in this case)
-    form.area.choices = [(i.area, i.area) for i in choices]
     if form.validate_on_submit():
         clinic = Clinic(email=form.email.data, name=form.name.data, area_name=form.area.data)
         # Password is set after constructor for encryption.
@@ -170,7 +237,15 @@ def edit_clinic(id):
     emergency_number = PhoneNumber.query.filter_by(clinic_id=current_user.id, primary_contact=False).first()
 
     if request.method == 'POST':
+        # Numbers are checked as belonging to this clinic from the server side id, not the hidden fields
+        form.main_number.clinic_id.data = current_user.id
+        form.emergency_number.clinic_id.data = current_user.id
         if form.validate_on_submit():
+            if not claim_version(Clinic, current_user.id, form.version.data):
+                flash('This profile was changed by someone else while you were editing it. '
+                      'Please review the current details and make your changes again.')
+                return redirect(url_for('edit_clinic', id=id))
+
             current_user.name = form.name.data
             current_user.area = form.area.data
             # Setter used for encryption
@@ -243,16 +318,7 @@ def add_volunteer():
     form = VolunteerForm()
     if request.method == 'POST':
         if form.validate_on_submit():
-            vol = Volunteer(fname=form.fname.data, lname=form.lname.data)
-            # Adds the selected areas to the vol object
-            for area in form.areas.data:
-                # Appends the areas as queried from the db (db.relationship represents a List)
-                vol.areas.append(Area.query.filter_by(area=area).first())
-
-            # Adds the selected species to the vol object
-            for species in form.species.data:
-                # Appends the species as queried from the db (db.relationship represents a List)
-                vol.species.append(FosterSpecies.query.filter_by(species=species).first())
+            vol = Volunteer(fname=form.fname.data, lname=form.lname.data, email=form.email.data or None)
 
             # Generates PhoneNumber(s) from form
             number1 = PhoneNumber(dial_code=form.phone1.dial_code.data,
@@ -281,8 +347,15 @@ def add_volunteer():
             if number2.dial_code and number2.phone_number:
                 vol.phone_numbers.append(number2)
             db.session.add(vol)
+            # Flushes to get vol.id for the area\species rows
+            db.session.flush()
+            update_volunteer_associations(vol.id, [], form.areas.data, [], form.species.data)
+            stats.volunteer_changed(None, stats.counted(vol.active, vol.black_listed, form.areas.data,
+                                                        form.species.data, vol.last_contacted))
+            vol_id = vol.id
             db.session.commit()
-            flash('Volunteer '+vol.fname + ' ' + vol.lname + ' registered successfully.')
+            events.publish_volunteer_event(events.ADDED, vol_id, current_user.id, form.areas.data, form.species.data)
+            flash('Volunteer '+form.fname.data + ' ' + form.lname.data + ' registered successfully.')
             return render_template('add_volunteer.html', title='Add Volunteer', form=form)
 
         else:
@@ -293,42 +366,73 @@ def add_volunteer():
         return render_template('add_volunteer.html', title='Add Volunteer', form=form)
 
 
+# Applies area\species changes of a volunteer as one bulk DELETE and one bulk INSERT per association table.
+# Names come from the forms' choices, which are already validated, so they don't have to be looked up first.
+def update_volunteer_associations(vol_id, old_areas, new_areas, old_species, new_species):
+    for table, column, old, new in ((areas_volunteers, 'area', old_areas, new_areas),
+                                    (volunteers_species, 'foster_species', old_species, new_species)):
+        removed = set(old) - set(new)
+        added = set(new) - set(old)
+        if removed:
+            db.session.execute(table.delete()
+                               .where(table.c.vol_id == vol_id)
+                               .where(table.c[column].in_(removed)))
+        if added:
+            db.session.execute(table.insert(), [{'vol_id': vol_id, column: name} for name in added])
+
+
 @app.route('/<id>/edit', methods=['GET', 'POST'])
 @login_required
 def edit_volunteer(id):
 
     # Queries volunteer object through id to populate most fields
     vol_edit = Volunteer.query.filter_by(id=id).first()
+
+    # Archived volunteers can be viewed here, but are only edited after being restored by setting them to active
+    if vol_edit is None:
+        vol_edit = ArchivedVolunteer.query.get_or_404(int(id))
+        if request.method == 'POST':
+            if request.form.get('active') and not request.form.get('black_listed'):
+                # Restored within this request's transaction, rolled back with it if the form doesn't validate
+                archive.restore([vol_edit.id])
+                vol_edit = Volunteer.query.filter_by(id=id).first()
+            else:
+                flash('Archived volunteers must be set to active (and not black listed) to be edited.')
+                return redirect(url_for('edit_volunteer', id=id))
+
     # obj=vol_edit pre-populates fields with volunteer data
     form = VolunteerForm(obj=vol_edit)
+    # Owner of the numbers for check_registered_numbers, rather than the posted hidden fields (empty on re-renders)
+    form.phone1.volunteer_id.data = form.phone2.volunteer_id.data = vol_edit.id
 
-    # Queries the phone numbers through volunteer object (by primary true/false) to pre-populate phone fields
-    phone1 = PhoneNumber.query.filter_by(volunteer_id=vol_edit.id, primary_contact=True).first()
-    phone2 = PhoneNumber.query.filter_by(volunteer_id=vol_edit.id, primary_contact=False).first()
+    # Takes the phone numbers from the volunteer object (by primary true/false) to pre-populate phone fields
+    phone1 = next((p for p in vol_edit.phone_numbers if p.primary_contact), None)
+    phone2 = next((p for p in vol_edit.phone_numbers if not p.primary_contact), None)
 
     if request.method == 'POST':
         if form.validate_on_submit():
+            if not claim_version(Volunteer, vol_edit.id, form.version.data):
+                flash('This volunteer was changed by someone else while you were editing. '
+                      'Please review the current details and make your changes again.')
+                return redirect(url_for('edit_volunteer', id=id))
+
+            # Kept for the edit event so dispatchers watching the old areas\species are notified too
+            old_areas = [a.area for a in vol_edit.areas]
+            old_species = [s.species for s in vol_edit.species]
+            stats.volunteer_changed(
+                stats.counted(vol_edit.active, vol_edit.black_listed, old_areas, old_species, vol_edit.last_contacted),
+                stats.counted(form.active.data, form.black_listed.data, form.areas.data, form.species.data,
+                              vol_edit.last_contacted))
+
             vol_edit.fname = form.fname.data
             vol_edit.lname = form.lname.data
+            vol_edit.email = form.email.data or None
             vol_edit.active = form.active.data
             vol_edit.black_listed = form.black_listed.data
             vol_edit.notes = form.notes.data
 
-            # Replaces old vol_edit.areas with new areas list
-            new_areas = []
-            for area in form.areas.data:
-                # Appends the areas as queried from the db (db.relationship represents a List)
-                new_areas.append(Area.query.filter_by(area=area).first())
-
-            vol_edit.areas = new_areas
-
-            # Replaces old vol_edit.species with new species list
-            new_species = []
-            for species in form.species.data:
-                # Appends the species as queried from the db (db.relationship represents a List)
-                new_species.append(FosterSpecies.query.filter_by(species=species).first())
-
-            vol_edit.species = new_species
+            # Replaces old areas\species with the new ones, only writing the difference
+            update_volunteer_associations(vol_edit.id, old_areas, form.areas.data, old_species, form.species.data)
 
             # Generates PhoneNumber(s) from form
             new_number1 = PhoneNumber(dial_code=form.phone1.dial_code.data,
@@ -387,8 +491,14 @@ def edit_volunteer(id):
                 # Uses phone1 because new_number1 was already passed to it
                 phone1.primary_contact = True
 
+            event_type = events.EDITED if form.active.data and not form.black_listed.data else events.DEACTIVATED
             db.session.commit()
-            flash('Volunteer '+vol_edit.fname + ' ' + vol_edit.lname + ' updated successfully.')
+            events.publish_volunteer_event(event_type, int(id), current_user.id, old_areas + form.areas.data,
+                                           old_species + form.species.data)
+            flash('Volunteer '+form.fname.data + ' ' + form.lname.data + ' updated successfully.')
+            # The re-rendered form must carry the new version to be saved again (raw_data would be rendered instead)
+            form.version.data += 1
+            form.version.raw_data = None
             return render_template('edit_volunteer.html', title='Edit Volunteer', form=form)
 
         else:
@@ -415,16 +525,33 @@ def edit_volunteer(id):
         return render_template('edit_volunteer.html', title='Edit Volunteer', id=int(id), form=form)
 
 
+# Search by phone if provided, else (or if the phone is not found) by fname and\or lname.
+# Shared by the volunteer and archived volunteer searches.
+def volunteer_search_query(model, phone_model, fname, lname, dial_code, phone_num):
+    number = phone_key(dial_code, phone_num)
+    # A single probe of the unique number index
+    query = model.query\
+        .join(model.phone_numbers)\
+        .filter(phone_model.number == number) if number is not None else None
+
+    if not query or not query.first():
+        if not fname or not lname:
+            query = model.query\
+                .filter(or_(model.fname.ilike(fname), model.lname.ilike(lname)))\
+                .distinct()
+        else:
+            query = model.query\
+                .filter(model.fname.ilike(fname))\
+                .filter(model.lname.ilike(lname))\
+                .distinct()
+    return query
+
+
 @login_required
-def search_volunteers(fname, lname, dial_code, phone_num):
+def search_volunteers(fname, lname, dial_code, phone_num, include_archived=False):
 
     search_form = SearchVolunteerForm(prefix='search_form')
 
-    # Resets the search page on search from inside the search page
-    if search_form.validate_on_submit() and search_form.data:
-        return search_volunteers(search_form.fname.data, search_form.lname.data,
-                                 search_form.dial_code.data, search_form.phone_number.data)
-
     if search_form.validate_on_submit():
         # Sets pagination to 1 on new search
         page = 1
@@ -432,26 +559,14 @@ def search_volunteers(fname, lname, dial_code, phone_num):
         # Sets page from args for next\prev
         page = request.args.get('page', 1, type=int)
 
-    # Search by phone if provided
-    query = Volunteer.query\
-        .join(Volunteer.phone_numbers)\
-        .filter(PhoneNumber.dial_code == dial_code)\
-        .filter(PhoneNumber.phone_number == phone_num)\
-        .distinct() if dial_code and phone_num else None
-
-    # Search by fname and\or lname if phone not provided or not found
-    if not query or not query.first():
-        if not fname or not lname:
-            query = Volunteer.query\
-                .filter(or_(Volunteer.fname.ilike(fname), Volunteer.lname.ilike(lname)))\
-                .distinct()
-        else:
-            query = Volunteer.query\
-                .filter(Volunteer.fname.ilike(fname))\
-                .filter(Volunteer.lname.ilike(lname))\
-                .distinct()
+    search_results = search_cache.paginate(
+        Volunteer, search_cache.VOLUNTEERS, search_cache.volunteer_terms(fname, lname, dial_code, phone_num), page,
+        lambda: volunteer_search_query(Volunteer, PhoneNumber, fname, lname, dial_code, phone_num))
 
-    search_results = query.paginate(page, 10, False)
+    # Archive matches are listed separately on the first page
+    archived_results = volunteer_search_query(ArchivedVolunteer, ArchivedPhoneNumber, fname, lname,
+                                              dial_code, phone_num).limit(10).all()\
+        if include_archived and page == 1 else []
 
     next_url = url_for('search_volunteers', page=search_results.next_num)\
         if search_results.has_next else None
@@ -459,7 +574,22 @@ def search_volunteers(fname, lname, dial_code, phone_num):
         if search_results.has_prev else None
 
     return render_template('search_volunteer.html', search_form=search_form, search_results=search_results.items,
-                           next_url=next_url, prev_url=prev_url)
+                           archived_results=archived_results, next_url=next_url, prev_url=prev_url)
+
+
+def clinic_search_query(email, name, dial_code, phone_num):
+    # Search by phone separately, through the unique number index
+    number = phone_key(dial_code, phone_num)
+    query = Clinic.query\
+        .join(Clinic.phone_numbers)\
+        .filter(PhoneNumber.number == number) if number is not None else None
+
+    # If phone is not provided or not found searches by name and email, defaults to all
+    if not query or not query.first():
+        query = Clinic.query\
+            .filter(or_(Clinic.name.ilike(name), Clinic.email.ilike(email)))\
+            .distinct() if name else Clinic.query
+    return query
 
 
 @app.route('/admin', methods=['GET', 'POST'])
@@ -479,20 +609,9 @@ def search_clinics():
         # Sets page from args for next\prev
         page = request.args.get('page', 1, type=int)
 
-    # Search by phone separately to filter with dial_code and phone_number
-    query = Clinic.query\
-        .join(Clinic.phone_numbers)\
-        .filter(PhoneNumber.dial_code == dial_code)\
-        .filter(PhoneNumber.phone_number == phone_num)\
-        .distinct() if dial_code and phone_num else None
-
-    # If phone is not provided or not found searches by name and email, defaults to all
-    if not query or not query.first():
-        query = Clinic.query\
-            .filter(or_(Clinic.name.ilike(name), Clinic.email.ilike(email)))\
-            .distinct() if name else Clinic.query
-
-    search_results = query.paginate(page, 10, False)
+    search_results = search_cache.paginate(Clinic, search_cache.CLINICS,
+                                           search_cache.clinic_terms(email, name, dial_code, phone_num), page,
+                                           lambda: clinic_search_query(email, name, dial_code, phone_num))
 
     next_url = url_for('search_clinics', page=search_results.next_num)\
         if search_results.has_next else None
@@ -503,13 +622,111 @@ def search_clinics():
                            next_url=next_url, prev_url=prev_url)
 
 
+@app.route('/admin/stats')
+@login_required
+def roster_stats():
+    if not current_user.admin:
+        return redirect(url_for('index'))
+
+    return render_template('stats.html', title='Roster Statistics', areas=reference.areas(),
+                           species=reference.species(), roster=stats.roster_table(),
+                           age_histogram=stats.age_histogram(), daily_contacts=stats.daily_contacts(),
+                           search_cache=search_cache.cache.stats())
+
+
+# Filter-based changes to many volunteers at once, "Count Matching" only counts them
+@app.route('/admin/bulk', methods=['GET', 'POST'])
+@login_required
+def bulk_volunteers():
+    if not current_user.admin:
+        return redirect(url_for('index'))
+
+    form = BulkVolunteerForm()
+    matching = None
+    if form.validate_on_submit():
+        if form.submit.data:
+            changed = bulk.apply(form.filters(), form.changes())
+            flash('Changed %d volunteers' % changed)
+            return redirect(url_for('bulk_volunteers'))
+        matching = bulk.count(form.filters())
+
+    return render_template('bulk_volunteers.html', title='Bulk Changes', form=form, matching=matching)
+
+
+# Emails a foster request to every matching volunteer, sent in the background (see main.broadcast)
+@app.route('/broadcast', methods=['GET', 'POST'])
+@login_required
+def broadcast_request():
+    form = BroadcastForm()
+    recipients = None
+    if form.validate_on_submit():
+        if form.submit.data:
+            created, recipients = broadcast.create(current_user.id, form.subject.data, form.message.data,
+                                                   form.areas.data, form.species.data)
+            db.session.commit()
+            broadcast.start(created.id)
+            flash('Sending the request to %d volunteers' % recipients)
+            return redirect(url_for('broadcast_request'))
+        recipients = broadcast.count(form.areas.data, form.species.data)
+
+    broadcasts = Broadcast.query.filter_by(clinic_id=current_user.id).order_by(Broadcast.id.desc()).limit(10).all()
+    return render_template('broadcast.html', title='Broadcast Request', form=form, recipients=recipients,
+                           broadcasts=broadcasts, counts=broadcast.status_counts([b.id for b in broadcasts]))
+
+
+@app.route('/admin/profiles')
+@login_required
+def profiles():
+    if not current_user.admin:
+        return redirect(url_for('index'))
+
+    return render_template('profiles.html', title='Request Profiles', captures=profiler.captures())
+
+
+# Collapsed stacks for flamegraph.pl\speedscope, or the whole capture with SQL timings as json
+@app.route('/admin/profiles/<name>')
+@login_required
+def download_profile(name):
+    if not current_user.admin:
+        return redirect(url_for('index'))
+
+    capture = profiler.load(name)
+    if capture is None:
+        abort(404)
+    if request.args.get('format') == 'json':
+        return jsonify(capture)
+    return Response(profiler.collapsed(capture), mimetype='text/plain',
+                    headers={'Content-Disposition': 'attachment; filename=%s.folded' % name[:-len('.json')]})
+
+
+# Phone numbers and the cycle form of a volunteer, fetched into the contact modal when "Call Volunteer" is clicked
+@app.route('/<id>/contact')
+@login_required
+def volunteer_contact(id):
+    phone_numbers = PhoneNumber.query.filter_by(volunteer_id=id).order_by(PhoneNumber.primary_contact.desc()).all()
+    if not phone_numbers and Volunteer.query.get(id) is None:
+        abort(404)
+    return render_template('_contact_info.html', volunteer_id=id, phone_numbers=phone_numbers)
+
+
 # Endpoint for updating volunteer's last_contacted
 @app.route('/<id>/cycle', methods=['GET', 'POST'])
 @login_required
 def cycle_to_bottom(id):
     volunteer = Volunteer.query.filter_by(id=id).first()
-    volunteer.last_contacted = datetime.utcnow()
+    vol_areas = [a.area for a in volunteer.areas]
+    vol_species = [s.species for s in volunteer.species]
+    now = datetime.utcnow()
+    if app.config['PER_CLINIC_ROTATION']:
+        # Moves the volunteer in this clinic's queue only, the shared last_contacted below still feeds the stats
+        touch_clinic_contact(current_user.id, volunteer.id, now)
+    stats.volunteer_changed(
+        stats.counted(volunteer.active, volunteer.black_listed, vol_areas, vol_species, volunteer.last_contacted),
+        stats.counted(volunteer.active, volunteer.black_listed, vol_areas, vol_species, now))
+    volunteer.last_contacted = now
+    stats.contact_made(current_user.id, now)
     db.session.commit()
+    events.publish_volunteer_event(events.CYCLED, int(id), current_user.id, vol_areas, vol_species)
     return '', 204
 
 
@@ -0,0 +1,214 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from flask_sqlalchemy import Pagination
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history
+
+from main import app, db, events
+from main.models import Volunteer, Clinic, PhoneNumber, phone_key
+
+# Result cache for search_volunteers and search_clinics: keeps the ids and total of a result page, keyed by the
+# normalized search terms and page, so a repeated search costs one primary key lookup instead of the phone query,
+# the name query and the count. Bounded LRU of SEARCH_CACHE_SIZE entries expiring after SEARCH_CACHE_TTL seconds.
+#
+# Invalidation is driven by writes: after every flush the old and new search values (names, email, phone numbers)
+# of the Volunteer, Clinic and PhoneNumber rows written are collected, and once the transaction commits every entry
+# those values could match is dropped. The change is sent through the event backend, so with the redis backend
+# the other workers drop their entries too. Set-based writes that bypass the session (archive\restore) drop
+# everything with invalidate_all_on_commit.
+
+PER_PAGE = 10
+# Rows written in one transaction above which the whole cache is dropped instead
+MAX_ROWS = 1000
+VOLUNTEERS = 'volunteers'
+CLINICS = 'clinics'
+PHONES = 'phones'
+GENERATION = 'search_cache_generation'
+
+
+# Same match as ilike, None and '' never match
+def _like(pattern, value):
+    if not pattern or not value:
+        return False
+    regex = ''.join('.*' if c == '%' else '.' if c == '_' else re.escape(c) for c in pattern)
+    return re.fullmatch(regex, value, re.IGNORECASE | re.DOTALL) is not None
+
+
+def _normalize(value):
+    value = (value or '').strip()
+    return value.lower() or None
+
+
+# Whether a row written (as {'kind': ..., values}) can change the results of a search (kind, terms)
+def _affects(kind, terms, row):
+    if row is None:
+        return True
+    if row['kind'] == PHONES:
+        owner = VOLUNTEERS if row['volunteer_id'] is not None else CLINICS if row['clinic_id'] is not None else None
+        return owner in (kind, None) and terms[-1] is not None and terms[-1] == row['number']
+    if row['kind'] != kind:
+        return False
+    if kind == VOLUNTEERS:
+        fname, lname = terms[0], terms[1]
+        if fname and lname:
+            return _like(fname, row['fname']) and _like(lname, row['lname'])
+        return _like(fname, row['fname']) or _like(lname, row['lname'])
+    email, name = terms[0], terms[1]
+    # Searches without a name list every clinic
+    return not name or _like(name, row['name']) or _like(email, row['email'])
+
+
+class SearchCache(object):
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped by every invalidation, results read while one happened are not stored
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def put(self, key, value, generation):
+        size = app.config['SEARCH_CACHE_SIZE']
+        with self._lock:
+            if generation != self.generation or not size:
+                return
+            self._entries[key] = (time.monotonic() + app.config['SEARCH_CACHE_TTL'], value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, rows):
+        with self._lock:
+            self.generation += 1
+            stale = [key for key in self._entries if any(_affects(key[0], key[1], row) for row in rows)]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses,
+                    'invalidations': self.invalidations}
+
+
+cache = SearchCache()
+
+
+# The phone is keyed by its canonical number, so searches for 050 and 50 share an entry
+def volunteer_terms(fname, lname, dial_code, phone_num):
+    return _normalize(fname), _normalize(lname), phone_key(dial_code, phone_num)
+
+
+def clinic_terms(email, name, dial_code, phone_num):
+    return _normalize(email), _normalize(name), phone_key(dial_code, phone_num)
+
+
+# Page of model instances for the search (kind, terms), run with query() on a miss
+def paginate(model, kind, terms, page, query):
+    key = (kind, terms, page)
+    value = cache.get(key)
+    if value is None:
+        # The generation when the transaction began, before its snapshot (MySQL REPEATABLE READ) was taken
+        generation = db.session.info.get(GENERATION, cache.generation)
+        results = query().paginate(page, PER_PAGE, False)
+        cache.put(key, ([item.id for item in results.items], results.total), generation)
+        return results
+
+    ids, total = value
+    loaded = {item.id: item for item in model.query.filter(model.id.in_(ids))} if ids else {}
+    return Pagination(None, page, PER_PAGE, total, [loaded[id] for id in ids if id in loaded])
+
+
+def _values(instance, kind, attributes, old):
+    values = {'kind': kind}
+    for attribute in attributes:
+        history = get_history(instance, attribute)
+        if old:
+            current = (history.deleted or history.unchanged or [None])[0]
+        else:
+            current = (history.added or history.unchanged or [None])[0]
+        values[attribute] = _normalize(current) if isinstance(current, str) else current
+    return values
+
+
+SEARCHED_ATTRIBUTES = (
+    (Volunteer, VOLUNTEERS, ('fname', 'lname')),
+    (Clinic, CLINICS, ('name', 'email')),
+    (PhoneNumber, PHONES, ('number', 'volunteer_id', 'clinic_id')),
+)
+
+
+# A result read in this transaction is only stored if nothing was invalidated since it began, see SearchCache.put
+@event.listens_for(Session, 'after_begin')
+def _begin_generation(session, transaction, connection):
+    session.info.setdefault(GENERATION, cache.generation)
+
+
+@event.listens_for(Session, 'after_transaction_end')
+def _end_generation(session, transaction):
+    if transaction.parent is None:
+        session.info.pop(GENERATION, None)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_writes(session, flush_context):
+    rows = session.info.setdefault('search_cache_rows', set())
+    if None in rows:
+        return
+    for instances, old, dirty in ((session.new, False, False), (session.dirty, True, True),
+                                  (session.dirty, False, True), (session.deleted, True, False)):
+        for instance in instances:
+            for model, kind, attributes in SEARCHED_ATTRIBUTES:
+                if not isinstance(instance, model):
+                    continue
+                # Updates that don't touch a searched value (e.g. cycling a volunteer) keep the cache
+                if dirty and not any(get_history(instance, a).has_changes() for a in attributes):
+                    continue
+                rows.add(tuple(sorted(_values(instance, kind, attributes, old).items())))
+    # Large transactions (imports, seeding) just drop everything
+    if len(rows) > MAX_ROWS:
+        rows.clear()
+        rows.add(None)
+
+
+# Dropped here right away, and in the other workers when the event reaches them
+@event.listens_for(Session, 'after_commit')
+def _publish_writes(session):
+    rows = session.info.pop('search_cache_rows', None)
+    if rows:
+        rows = [dict(row) if row is not None else None for row in rows]
+        cache.invalidate(rows)
+        events.publish_search_change(rows)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_writes(session):
+    session.info.pop('search_cache_rows', None)
+
+
+# For writes made with Core statements, drops the whole cache when the current transaction commits
+def invalidate_all_on_commit(session):
+    session.info.setdefault('search_cache_rows', set()).add(None)
+
+
+def _on_event(event):
+    if event['type'] == events.SEARCH_CHANGED:
+        cache.invalidate(event['rows'])
+
+
+events.hub.add_listener(_on_event)
@@ -0,0 +1,172 @@
+import http.client
+import re
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+
+from main import app, db, mail, stats
+from main.models import Clinic, Volunteer, Area, FosterSpecies
+
+# Dispatcher load simulation. Every simulated dispatcher logs in as one clinic and loops the way a person does:
+# open index for the chosen areas\species, "call" the volunteer shown for call_seconds, then cycle them to the bottom.
+# Runs in-process against the Flask app (test clients in threads) or over HTTP against a running server.
+#
+# Index pages only link each volunteer's contact fragment (data-contact-url), the cycle form is in that fragment,
+# so a dispatcher fetches it the way the "Call Volunteer" button does before cycling.
+#
+# A hand-out lasts from the moment index showed a volunteer until their cycle returned. Two dispatchers holding
+# hand-outs of the same volunteer at the same time is a duplicate: two clinics calling the same person.
+
+CONTACT_URL = re.compile(r'data-contact-url="[^"]*/(\d+)/contact"')
+CYCLE_ACTION = re.compile(r'/(\d+)/cycle')
+SIM_EMAIL = 'sim-%d@example.invalid'
+
+
+class Result(object):
+    def __init__(self):
+        self.index_latencies = []
+        self.contact_latencies = []
+        self.cycle_latencies = []
+        # (volunteer id, dispatcher, shown at, cycled at)
+        self.hand_outs = []
+        self.errors = []
+        self.empty = 0
+        self._lock = threading.Lock()
+
+    def record(self, index_latency, contact_latency, cycle_latency, hand_out):
+        with self._lock:
+            self.index_latencies.append(index_latency)
+            self.contact_latencies.append(contact_latency)
+            self.cycle_latencies.append(cycle_latency)
+            self.hand_outs.append(hand_out)
+
+    def error(self, error):
+        with self._lock:
+            self.errors.append(error)
+
+    def duplicates(self):
+        by_volunteer = {}
+        for vol_id, dispatcher, start, end in self.hand_outs:
+            by_volunteer.setdefault(vol_id, []).append((start, end, dispatcher))
+        total = 0
+        for hand_outs in by_volunteer.values():
+            hand_outs.sort()
+            for i, (start, end, dispatcher) in enumerate(hand_outs):
+                # Sorted by start, so only earlier hand-outs still open at start can overlap
+                if any(other != dispatcher and other_end > start for _, other_end, other in hand_outs[:i]):
+                    total += 1
+        return total
+
+
+class InProcessClient(object):
+    def __init__(self, clinic_id):
+        self.client = app.test_client()
+        with self.client.session_transaction() as session:
+            session['_user_id'] = str(clinic_id)
+            session['_fresh'] = True
+
+    def get(self, path):
+        response = self.client.get(path)
+        return response.status_code, response.get_data(as_text=True)
+
+    def post(self, path):
+        response = self.client.post(path)
+        return response.status_code, response.get_data(as_text=True)
+
+
+class HttpClient(object):
+    def __init__(self, url, cookie):
+        parts = urlsplit(url)
+        self.connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=60)
+        self.prefix = parts.path.rstrip('/')
+        self.cookie = cookie
+
+    def _request(self, method, path):
+        self.connection.request(method, self.prefix + path, headers={'Cookie': self.cookie})
+        response = self.connection.getresponse()
+        return response.status, response.read().decode('utf-8')
+
+    def get(self, path):
+        return self._request('GET', path)
+
+    def post(self, path):
+        return self._request('POST', path)
+
+
+def dispatcher(number, client, areas, species, call_seconds, deadline, result):
+    path = '/index?' + urlencode([('areas', a) for a in areas] + [('species', s) for s in species])
+    while time.monotonic() < deadline:
+        try:
+            start = time.monotonic()
+            status, body = client.get(path)
+            shown = time.monotonic()
+            match = CONTACT_URL.search(body)
+            if status != 200 or match is None:
+                if status == 200:
+                    result.empty += 1
+                else:
+                    result.error(status)
+                continue
+
+            status, body = client.get('/%s/contact' % match.group(1))
+            contacted = time.monotonic()
+            match = CYCLE_ACTION.search(body)
+            if status != 200 or match is None:
+                result.error(status if status != 200 else 'no cycle form in contact fragment')
+                continue
+
+            time.sleep(call_seconds)
+            cycle_start = time.monotonic()
+            status, _ = client.post('/%s/cycle' % match.group(1))
+            end = time.monotonic()
+            if status != 204:
+                result.error(status)
+                continue
+            result.record(shown - start, contacted - shown, end - cycle_start,
+                          (int(match.group(1)), number, shown, end))
+        except Exception as e:
+            result.error(repr(e))
+
+
+def run(clients, areas, species, duration, call_seconds):
+    result = Result()
+    deadline = time.monotonic() + duration
+    threads = [threading.Thread(target=dispatcher, args=(i, client, areas, species, call_seconds, deadline, result))
+               for i, client in enumerate(clients)]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.monotonic() - start, result
+
+
+# Points Flask-Mail of this process at the given SMTP server, used with smtp_stub in-process
+def use_mail_server(host, port):
+    app.config.update(MAIL_SERVER=host, MAIL_PORT=port, MAIL_USE_TLS=False, MAIL_USE_SSL=False,
+                      MAIL_USERNAME=None, MAIL_PASSWORD=None)
+    mail.init_app(app)
+
+
+# Creates the simulation clinics that don't exist yet and volunteers volunteers fostering every one of species in
+# every one of areas. Returns the clinic ids.
+def seed(clinics, volunteers, areas, species):
+    area_rows = Area.query.filter(Area.area.in_(areas)).all()
+    species_rows = FosterSpecies.query.filter(FosterSpecies.species.in_(species)).all()
+    clinic_ids = []
+    for i in range(clinics):
+        clinic = Clinic.query.filter_by(email=SIM_EMAIL % i).first()
+        if clinic is None:
+            clinic = Clinic(email=SIM_EMAIL % i, name='Simulated Clinic %d' % i, area_name=areas[0], active=True)
+            db.session.add(clinic)
+            db.session.flush()
+        clinic_ids.append(clinic.id)
+
+    for i in range(volunteers):
+        db.session.add(Volunteer(fname='Simulated', lname=str(i), areas=area_rows, species=species_rows))
+        if i % 500 == 499:
+            db.session.flush()
+    db.session.commit()
+    if volunteers:
+        stats.reconcile()
+    return clinic_ids
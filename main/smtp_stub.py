@@ -0,0 +1,68 @@
+import socketserver
+import threading
+
+# Local SMTP stand-in for simulations and trying out email features without a mail server.
+# Speaks just enough SMTP for smtplib (and so Flask-Mail): accepts every message, keeps a count and the
+# recipients of the last messages, and never delivers anything.
+
+MAX_KEPT = 1000
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def _reply(self, line):
+        self.wfile.write((line + '\r\n').encode('ascii'))
+
+    def handle(self):
+        self._reply('220 localhost SMTP stub')
+        recipients = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('latin-1').strip()
+            verb = command[:4].upper()
+            if verb in ('HELO', 'EHLO'):
+                self._reply('250 localhost')
+            elif verb == 'MAIL':
+                recipients = []
+                self._reply('250 OK')
+            elif verb == 'RCPT':
+                recipients.append(command.split(':', 1)[1].strip().strip('<>'))
+                self._reply('250 OK')
+            elif verb == 'DATA':
+                self._reply('354 End data with <CR><LF>.<CR><LF>')
+                while self.rfile.readline() not in (b'.\r\n', b'.\n', b''):
+                    pass
+                self.server.received(recipients)
+                self._reply('250 OK')
+            elif verb == 'QUIT':
+                self._reply('221 Bye')
+                return
+            else:
+                # RSET, NOOP and anything else
+                self._reply('250 OK')
+
+
+class SmtpStub(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=0):
+        super(SmtpStub, self).__init__((host, port), _Handler)
+        self.messages = 0
+        self.recipients = []
+        self._lock = threading.Lock()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def received(self, recipients):
+        with self._lock:
+            self.messages += 1
+            self.recipients = (self.recipients + recipients)[-MAX_KEPT:]
+
+    # Serves from a daemon thread, returns self so it can be used as `stub = SmtpStub().start()`
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
@@ -0,0 +1,160 @@
+import multiprocessing
+import random
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import Pool
+
+from main import app
+
+# Single-node SQLite profile, enabled by SQLITE_TUNED (the default for SQLite file databases).
+# WAL lets readers run alongside the one writer, and synchronous=NORMAL only fsyncs at checkpoints instead of on
+# every commit (a power loss can drop the last commits but never corrupts the db).
+#
+# Writers: the driver's own transaction handling is kept, it only sends BEGIN right before the first write
+# statement, so reads never hold a snapshot that a later write would have to upgrade (the case where SQLite fails
+# with "database is locked" at once instead of waiting busy_timeout). Within a process, writing transactions
+# additionally queue on a lock from their first write statement until commit or rollback, so threads wait their
+# turn instead of polling the db file through busy_timeout. busy_timeout is then only spent waiting on other processes.
+
+READ_STATEMENTS = ('SELECT', 'PRAGMA')
+
+
+# Reentrant like an RLock, so a thread writing on a second connection doesn't wait for itself, but released for
+# the thread that took it rather than by it: connections can be checked in (and rolled back) from another thread,
+# e.g. the one closing a scoped session, where RLock.release raises RuntimeError.
+class _WriterLock(object):
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._owner = None
+        self._count = 0
+
+    # Returns the owner to pass to release()
+    def acquire(self):
+        me = threading.get_ident()
+        with self._condition:
+            while self._owner not in (None, me):
+                self._condition.wait()
+            self._owner = me
+            self._count += 1
+        return me
+
+    def release(self, owner):
+        with self._condition:
+            if self._owner != owner:
+                return
+            self._count -= 1
+            if not self._count:
+                self._owner = None
+                self._condition.notify()
+
+
+_writer_lock = _WriterLock()
+
+
+def _is_sqlite(dbapi_connection):
+    return app.config['SQLITE_TUNED'] and isinstance(dbapi_connection, sqlite3.Connection)
+
+
+@event.listens_for(Engine, 'connect')
+def _set_pragmas(dbapi_connection, connection_record):
+    if not _is_sqlite(dbapi_connection):
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute('PRAGMA busy_timeout=%d' % app.config['SQLITE_BUSY_TIMEOUT_MS'])
+    cursor.execute('PRAGMA cache_size=-%d' % app.config['SQLITE_CACHE_KB'])
+    cursor.execute('PRAGMA mmap_size=%d' % app.config['SQLITE_MMAP_SIZE'])
+    cursor.execute('PRAGMA temp_store=MEMORY')
+    cursor.close()
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _queue_writer(conn, cursor, statement, parameters, context, executemany):
+    if 'sqlite_writer' in conn.info or not _is_sqlite(conn.connection.connection):
+        return
+    if statement.lstrip()[:6].upper() not in READ_STATEMENTS:
+        conn.info['sqlite_writer'] = _writer_lock.acquire()
+
+
+def _release_writer(info):
+    owner = info.pop('sqlite_writer', None)
+    if owner is not None:
+        _writer_lock.release(owner)
+
+
+@event.listens_for(Engine, 'commit')
+def _release_on_commit(conn):
+    _release_writer(conn.info)
+
+
+@event.listens_for(Engine, 'rollback')
+def _release_on_rollback(conn):
+    _release_writer(conn.info)
+
+
+# Connections returned to the pool without an explicit commit\rollback are rolled back by the pool
+@event.listens_for(Pool, 'checkin')
+def _release_on_checkin(dbapi_connection, connection_record):
+    _release_writer(connection_record.info)
+
+
+# Load for `flask sqlite-bench`: the rotation queue read and the cycle_to_bottom write, run from separate processes
+def _bench_worker(kind, ids, seconds, results):
+    from main.models import Volunteer
+    from main import db, queries, stats
+
+    db.engine.dispose()
+    operations, locked, latencies = 0, 0, []
+    deadline = time.monotonic() + seconds
+    with app.app_context():
+        while time.monotonic() < deadline:
+            start = time.monotonic()
+            try:
+                if kind == 'reader':
+                    db.session.execute(queries.rotation_queue([], [])).fetchall()
+                else:
+                    now = datetime.utcnow()
+                    Volunteer.query.get(random.choice(ids)).last_contacted = now
+                    stats.contact_made(1, now)
+                db.session.commit()
+            except OperationalError as e:
+                db.session.rollback()
+                if 'locked' not in str(e):
+                    raise
+                locked += 1
+                continue
+            operations += 1
+            latencies.append(time.monotonic() - start)
+    results.put((kind, operations, locked, latencies))
+
+
+def benchmark(readers, writers, seconds):
+    from main.models import Volunteer
+    from main import db
+
+    ids = [row[0] for row in db.session.query(Volunteer.id)]
+    db.session.remove()
+    db.engine.dispose()
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    processes = [context.Process(target=_bench_worker, args=(kind, ids, seconds, results))
+                 for kind in ['reader'] * readers + ['writer'] * writers]
+    for process in processes:
+        process.start()
+    totals = {}
+    for _ in processes:
+        kind, operations, locked, latencies = results.get()
+        total = totals.setdefault(kind, [0, 0, []])
+        total[0] += operations
+        total[1] += locked
+        total[2].extend(latencies)
+    for process in processes:
+        process.join()
+    return totals
@@ -0,0 +1,128 @@
+from collections import Counter
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, func, and_, text, bindparam
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+
+from main import db
+from main.models import Clinic, Volunteer, RosterCount, LastContactedCount, DailyContactCount, areas_volunteers, \
+    volunteers_species
+
+# Roster statistics counters. Every write path that changes who is in the rotation reports the volunteer's
+# counted state before and after the change, and only the difference is applied, so the dashboard never scans
+# the volunteer tables. reconcile() rebuilds the counters from the source tables to correct any drift.
+
+volunteer = Volunteer.__table__
+roster_count = RosterCount.__table__
+last_contacted_count = LastContactedCount.__table__
+daily_contact_count = DailyContactCount.__table__
+
+# (days from, days to, label) of the last_contacted age histogram
+AGE_BUCKETS = [
+    (0, 7, 'Less than a week'),
+    (7, 30, '1-4 weeks'),
+    (30, 90, '1-3 months'),
+    (90, 180, '3-6 months'),
+    (180, 365, '6-12 months'),
+    (365, None, 'Over a year'),
+]
+
+
+# Adds the deltas to the counter column, one multi-row upsert for all of [(key, delta)], creating missing rows
+def _increment(table, column, deltas):
+    keys = list(deltas[0][0])
+    rows = [dict(key, **{column: delta}) for key, delta in deltas]
+    if db.session.bind.dialect.name == 'mysql':
+        stmt = mysql_insert(table).values(rows)
+        db.session.execute(stmt.on_duplicate_key_update(**{column: table.c[column] + stmt.inserted[column]}))
+        return
+
+    # SQLAlchemy 1.3 has no ON CONFLICT construct for SQLite, same statement as text with typed parameters
+    names = keys + [column]
+    values = ', '.join('(%s)' % ', '.join(':%s_%d' % (name, i) for name in names) for i in range(len(rows)))
+    stmt = text('INSERT INTO %s (%s) VALUES %s ON CONFLICT (%s) DO UPDATE SET %s = %s.%s + excluded.%s'
+                % (table.name, ', '.join(names), values, ', '.join(keys), column, table.name, column, column))
+    stmt = stmt.bindparams(*[bindparam('%s_%d' % (name, i), type_=table.c[name].type)
+                             for i in range(len(rows)) for name in names])
+    db.session.execute(stmt, {'%s_%d' % (name, i): row[name] for i, row in enumerate(rows) for name in names})
+
+
+# What a volunteer adds to the counters, None if it isn't counted (inactive or black-listed)
+def counted(active, black_listed, areas, species, last_contacted):
+    if not active or black_listed:
+        return None
+    return [(a, s) for a in areas for s in species], last_contacted.date() if last_contacted else None
+
+
+# before\after are results of counted(), applied within the caller's transaction
+def volunteer_changed(before, after):
+    pairs = Counter()
+    days = Counter()
+    for state, sign in ((before, -1), (after, 1)):
+        if state is None:
+            continue
+        for pair in state[0]:
+            pairs[pair] += sign
+        if state[1] is not None:
+            days[state[1]] += sign
+
+    roster = [({'area': area, 'species': species}, delta) for (area, species), delta in pairs.items() if delta]
+    if roster:
+        _increment(roster_count, 'volunteers', roster)
+    ages = [({'day': day}, delta) for day, delta in days.items() if delta]
+    if ages:
+        _increment(last_contacted_count, 'volunteers', ages)
+
+
+def contact_made(clinic_id, when):
+    _increment(daily_contact_count, 'contacts', [({'clinic_id': clinic_id, 'day': when.date()}, 1)])
+
+
+# Rebuilds the roster counters from the volunteer tables. Daily contacts are a log of past events with no source
+# to rebuild them from, so they are left as they are.
+def reconcile():
+    # Same conditions as the rotation queue in index
+    active = and_(volunteer.c.active.is_(True), volunteer.c.black_listed.is_(False))
+
+    db.session.execute(roster_count.delete())
+    db.session.execute(roster_count.insert().from_select(
+        ['area', 'species', 'volunteers'],
+        select([areas_volunteers.c.area, volunteers_species.c.foster_species, func.count()])
+        .select_from(volunteer
+                     .join(areas_volunteers, areas_volunteers.c.vol_id == volunteer.c.id)
+                     .join(volunteers_species, volunteers_species.c.vol_id == volunteer.c.id))
+        .where(active)
+        .group_by(areas_volunteers.c.area, volunteers_species.c.foster_species)))
+
+    db.session.execute(last_contacted_count.delete())
+    day = func.date(volunteer.c.last_contacted)
+    db.session.execute(last_contacted_count.insert().from_select(
+        ['day', 'volunteers'],
+        select([day, func.count()]).where(active).where(volunteer.c.last_contacted.isnot(None)).group_by(day)))
+
+    db.session.commit()
+
+
+def roster_table():
+    return {(row.area, row.species): row.volunteers for row in RosterCount.query.filter(RosterCount.volunteers != 0)}
+
+
+def age_histogram():
+    today = datetime.utcnow().date()
+    totals = [0] * len(AGE_BUCKETS)
+    for row in LastContactedCount.query.filter(LastContactedCount.volunteers != 0):
+        age = (today - row.day).days
+        for i, (start, end, label) in enumerate(AGE_BUCKETS):
+            if age >= start and (end is None or age < end):
+                totals[i] += row.volunteers
+                break
+    return [(label, total) for (start, end, label), total in zip(AGE_BUCKETS, totals)]
+
+
+# (day, clinic name, contacts) for the last days, newest first
+def daily_contacts(days=14):
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+    return db.session.query(DailyContactCount.day, Clinic.name, DailyContactCount.contacts)\
+        .join(Clinic, Clinic.id == DailyContactCount.clinic_id)\
+        .filter(DailyContactCount.day >= since)\
+        .order_by(DailyContactCount.day.desc(), Clinic.name).all()
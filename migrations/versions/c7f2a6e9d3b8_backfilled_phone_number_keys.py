@@ -0,0 +1,64 @@
+"""Backfilled phone number keys
+
+Revision ID: c7f2a6e9d3b8
+Revises: b5e8d1f4a7c3
+Create Date: 2026-10-19 19:55:41.731902
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from main.backfill import backfill
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7f2a6e9d3b8'
+down_revision = 'b5e8d1f4a7c3'
+branch_labels = None
+depends_on = None
+
+
+def _table(name):
+    return sa.table(name,
+                    sa.column('dial_code', sa.String),
+                    sa.column('phone_number', sa.String),
+                    sa.column('number', sa.BigInteger),
+                    sa.column('clinic_id', sa.Integer),
+                    sa.column('volunteer_id', sa.Integer))
+
+
+phone_number = _table('phone_number')
+archived_phone_number = _table('archived_phone_number')
+
+
+# Same as models.phone_key for the digits-only values the forms allow
+def _key(table):
+    return {'number': sa.cast(table.c.dial_code + table.c.phone_number, sa.BigInteger)}
+
+
+# Rows still without a key, numbers missing either part keep a NULL key like models.phone_key gives them
+# (CAST('' AS ...) would be 0)
+def _unkeyed(table, owner):
+    return sa.and_(table.c.number.is_(None), table.c[owner].isnot(None),
+                   table.c.dial_code != '', table.c.phone_number != '')
+
+
+def upgrade():
+    # The phone tables have no integer key, so they are walked by owner, a chunk updating every number of its owners
+    backfill('phone_number.number.volunteer', phone_number, _key(phone_number),
+             _unkeyed(phone_number, 'volunteer_id'), pk='volunteer_id')
+    backfill('phone_number.number.clinic', phone_number, _key(phone_number),
+             _unkeyed(phone_number, 'clinic_id'), pk='clinic_id')
+    backfill('archived_phone_number.number', archived_phone_number, _key(archived_phone_number),
+             _unkeyed(archived_phone_number, 'volunteer_id'), pk='volunteer_id')
+
+    # Fails if a number was registered twice with different dial code spellings (050\50), merge those first
+    op.create_index(op.f('ix_phone_number_number'), 'phone_number', ['number'], unique=True)
+    op.create_index(op.f('ix_archived_phone_number_number'), 'archived_phone_number', ['number'], unique=True)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_archived_phone_number_number'), table_name='archived_phone_number')
+    op.drop_index(op.f('ix_phone_number_number'), table_name='phone_number')
+    op.execute(sa.text("DELETE FROM backfill_progress WHERE name IN ('phone_number.number.volunteer', "
+                       "'phone_number.number.clinic', 'archived_phone_number.number')"))
@@ -0,0 +1,35 @@
+"""Backfilled clinic active and admin
+
+Revision ID: f6d3a8e2c5b1
+Revises: e2b7c9a4f1d3
+Create Date: 2026-10-19 19:04:37.902615
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from main.backfill import backfill
+
+
+# revision identifiers, used by Alembic.
+revision = 'f6d3a8e2c5b1'
+down_revision = 'e2b7c9a4f1d3'
+branch_labels = None
+depends_on = None
+
+
+clinic = sa.table('clinic',
+                  sa.column('id', sa.Integer),
+                  sa.column('active', sa.Boolean),
+                  sa.column('admin', sa.Boolean))
+
+
+def upgrade():
+    # Clinics registered before 0cd467e15202\0878af7f5ece have NULLs, set them to the model defaults
+    backfill('clinic.active', clinic, {'active': True}, clinic.c.active.is_(None))
+    backfill('clinic.admin', clinic, {'admin': False}, clinic.c.admin.is_(None))
+
+
+def downgrade():
+    # The backfilled values can't be told apart from ones set since, they are kept
+    op.execute(sa.text("DELETE FROM backfill_progress WHERE name IN ('clinic.active', 'clinic.admin')"))
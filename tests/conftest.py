@@ -0,0 +1,42 @@
+import os
+import tempfile
+
+import pytest
+
+# The app reads its database from the environment on import
+_db_file = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+_db_file.close()
+os.environ['DATABASE_URL'] = 'sqlite:///' + _db_file.name
+
+from main import app as flask_app, db  # noqa: E402
+from main.models import Area, Clinic, FosterSpecies  # noqa: E402
+
+
+@pytest.fixture
+def app():
+    flask_app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    with flask_app.app_context():
+        db.create_all()
+        db.session.add_all([Area(area=area) for area in ('North', 'Center', 'South')])
+        db.session.add_all([FosterSpecies(species=species) for species in ('dog', 'cat', 'other')])
+        clinic = Clinic(email='clinic@example.com', name='Clinic', area_name='North', active=True, admin=True)
+        clinic.set_password('password')
+        db.session.add(clinic)
+        db.session.commit()
+        yield flask_app
+        db.session.remove()
+        db.drop_all()
+
+
+# Test client logged in as the admin clinic
+@pytest.fixture
+def client(app):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = '1'
+        session['_fresh'] = True
+    return client
+
+
+def pytest_unconfigure(config):
+    os.remove(_db_file.name)
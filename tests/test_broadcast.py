@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from main import db, broadcast, email
+from main.models import Area, FosterSpecies, Volunteer, Broadcast, BroadcastRecipient
+
+
+@pytest.fixture
+def created(app):
+    north = Area.query.get('North')
+    dog = FosterSpecies.query.get('dog')
+    for i in range(12):
+        db.session.add(Volunteer(fname='V%d' % i, lname='L', email='v%d@example.com' % i, areas=[north],
+                                 species=[dog]))
+    db.session.commit()
+    created, recipients = broadcast.create(1, 'Puppy', 'Needs a home', ['North'], ['dog'])
+    db.session.commit()
+    assert recipients == 12
+    return created.id
+
+
+# Records the recipients mailed instead of connecting to a mail server
+@pytest.fixture
+def mailed(monkeypatch):
+    mailed = []
+
+    def send_batch(messages, throttle=None):
+        mailed.extend(message.recipients[0] for message in messages)
+        return [None] * len(messages)
+
+    monkeypatch.setattr(email, 'send_batch', send_batch)
+    return mailed
+
+
+def statuses(broadcast_id):
+    return broadcast.status_counts([broadcast_id])[broadcast_id]
+
+
+def test_claimed_rows_are_left_to_their_sender(created):
+    rows = broadcast._pending(created, 0, 5)
+    assert [row.volunteer_id for row in broadcast._claim(created, rows, 'first')] == [1, 2, 3, 4, 5]
+    assert broadcast._claim(created, rows, 'second') == []
+
+    # Overlapping batch: only the rows nobody holds are claimed
+    rows = broadcast._pending(created, 0, 8)
+    assert [row.volunteer_id for row in broadcast._claim(created, rows, 'second')] == [6, 7, 8]
+
+
+def test_expired_claims_are_claimed_again(app, created):
+    rows = broadcast._pending(created, 0, 4)
+    broadcast._claim(created, rows, 'stopped')
+    # Two of the claims are older than the lease
+    old = datetime.utcnow() - timedelta(seconds=app.config['BROADCAST_CLAIM_SECONDS'] + 1)
+    BroadcastRecipient.query.filter(BroadcastRecipient.volunteer_id.in_([1, 2]))\
+        .update({BroadcastRecipient.claimed_at: old}, synchronize_session=False)
+    db.session.commit()
+
+    assert [row.volunteer_id for row in broadcast._claim(created, rows, 'next')] == [1, 2]
+
+
+def test_send_skips_recipients_held_by_another_sender(app, created, mailed):
+    broadcast._claim(created, broadcast._pending(created, 0, 3), 'other')
+
+    assert broadcast.send(created, batch_size=5, rate=0) == 9
+    assert sorted(mailed) == sorted('v%d@example.com' % i for i in range(3, 12))
+    assert statuses(created) == {broadcast.PENDING: 3, broadcast.SENT: 9, broadcast.FAILED: 0}
+    # Not finished while the other sender's recipients are pending
+    assert Broadcast.query.get(created).finished_at is None
+
+    # The other sender stopped, its claims expire and the next run sends them
+    BroadcastRecipient.query.update({BroadcastRecipient.claimed_at: datetime.utcnow() - timedelta(days=1)},
+                                    synchronize_session=False)
+    db.session.commit()
+    assert broadcast.send(created, batch_size=5, rate=0) == 3
+    assert len(mailed) == len(set(mailed)) == 12
+    assert Broadcast.query.get(created).finished_at is not None
+
+
+def test_unsent_rows_are_released(created, monkeypatch):
+    # The connection drops after two messages of the first batch
+    monkeypatch.setattr(email, 'send_batch', lambda messages, throttle=None: [None, None])
+    rows = broadcast._pending(created, 0, 5)
+    claimed = broadcast._claim(created, rows, 'sender')
+    broadcast._record(created, claimed, email.send_batch([]))
+
+    released = BroadcastRecipient.query.filter(BroadcastRecipient.volunteer_id.in_([3, 4, 5])).all()
+    assert all(r.claimed_at is None and r.claimed_by is None and r.status == broadcast.PENDING for r in released)
+    assert statuses(created)[broadcast.SENT] == 2
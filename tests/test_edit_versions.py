@@ -0,0 +1,46 @@
+from main import db
+from main.models import Clinic, Volunteer
+
+from tests.test_phone_numbers import volunteer_data
+
+
+def add_volunteer(client):
+    client.post('/add-volunteer', data=volunteer_data(('050', '1234567')))
+    return Volunteer.query.one()
+
+
+def test_volunteer_saved_with_current_version(client):
+    volunteer = add_volunteer(client)
+    response = client.post('/%d/edit' % volunteer.id,
+                           data=volunteer_data(('050', '1234567'), fname='Noa', active='y', version='1'))
+    assert response.status_code == 200
+    db.session.expire_all()
+    assert (volunteer.fname, volunteer.version) == ('Noa', 2)
+
+
+def test_volunteer_stale_version_is_a_conflict(client):
+    volunteer = add_volunteer(client)
+    response = client.post('/%d/edit' % volunteer.id,
+                           data=volunteer_data(('050', '1234567'), fname='Noa', active='y', version='0'))
+    assert response.status_code == 302
+    db.session.expire_all()
+    assert (volunteer.fname, volunteer.version) == ('Dana', 1)
+
+
+def test_volunteer_missing_version_is_a_conflict(client):
+    volunteer = add_volunteer(client)
+    response = client.post('/%d/edit' % volunteer.id,
+                           data=volunteer_data(('050', '1234567'), fname='Noa', active='y'))
+    assert response.status_code == 302
+    db.session.expire_all()
+    assert (volunteer.fname, volunteer.version) == ('Dana', 1)
+
+
+def test_clinic_missing_version_is_a_conflict(client):
+    response = client.post('/1/edit-clinic', data={
+        'name': 'Renamed', 'area': 'North',
+        'main_number-dial_code': '050', 'main_number-phone_number': '1234567',
+        'emergency_number-dial_code': '052', 'emergency_number-phone_number': '7654321'})
+    assert response.status_code == 302
+    clinic = Clinic.query.get(1)
+    assert (clinic.name, clinic.version) == ('Clinic', 1)
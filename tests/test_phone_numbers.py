@@ -0,0 +1,71 @@
+from main import db, archive
+from main.models import Volunteer, PhoneNumber, ArchivedPhoneNumber, phone_key
+
+
+def volunteer_data(phone1, phone2=('', ''), **data):
+    return dict({'fname': 'Dana', 'lname': 'Levi', 'areas': ['North'], 'species': ['dog'],
+                 'phone1-dial_code': phone1[0], 'phone1-phone_number': phone1[1],
+                 'phone2-dial_code': phone2[0], 'phone2-phone_number': phone2[1]}, **data)
+
+
+def test_dial_code_spellings_share_a_key():
+    assert phone_key('050', '1234567') == phone_key('50', '1234567') == 501234567
+    assert phone_key('050', '123-4567') == 501234567
+    assert phone_key('050', '1234567') != phone_key('052', '1234567')
+
+
+def test_empty_number_is_unkeyed(app):
+    assert phone_key('', '') is None
+    assert phone_key('050', '') is None
+    assert phone_key(None, '1234567') is None
+    number = PhoneNumber(dial_code='', phone_number='', clinic_id=1, primary_contact=False)
+    db.session.add(number)
+    db.session.commit()
+    assert number.number is None
+
+
+def test_stored_key_matches_other_spelling(client):
+    client.post('/add-volunteer', data=volunteer_data(('050', '1234567')))
+    assert PhoneNumber.query.one().number == phone_key('50', '1234567')
+
+    response = client.post('/add-volunteer', data=volunteer_data(('50', '1234567'), fname='Noa'))
+    assert 'This phone number already exists in the system.' in response.get_data(as_text=True)
+    assert Volunteer.query.count() == 1
+
+
+def test_volunteer_form_rejects_repeated_number(client):
+    response = client.post('/add-volunteer', data=volunteer_data(('050', '1234567'), ('50', '1234567')))
+    assert response.status_code == 200
+    assert 'This phone number was entered twice.' in response.get_data(as_text=True)
+    assert Volunteer.query.count() == 0
+
+
+def test_clinic_form_rejects_repeated_number(client):
+    response = client.post('/1/edit-clinic', data={
+        'name': 'Clinic', 'area': 'North', 'version': '1',
+        'main_number-dial_code': '050', 'main_number-phone_number': '1234567',
+        'emergency_number-dial_code': '50', 'emergency_number-phone_number': '1234567'})
+    assert response.status_code == 200
+    assert 'This phone number was entered twice.' in response.get_data(as_text=True)
+    assert PhoneNumber.query.count() == 0
+
+
+def test_clinic_keeps_its_own_numbers(client):
+    data = {'name': 'Clinic', 'area': 'North', 'version': '1',
+            'main_number-dial_code': '050', 'main_number-phone_number': '1234567',
+            'emergency_number-dial_code': '052', 'emergency_number-phone_number': '7654321'}
+    assert client.post('/1/edit-clinic', data=data).status_code == 302
+    data['version'] = '2'
+    assert client.post('/1/edit-clinic', data=data).status_code == 302
+    assert sorted(number.number for number in PhoneNumber.query) == [501234567, 527654321]
+
+
+def test_archived_number_is_taken(client):
+    client.post('/add-volunteer', data=volunteer_data(('050', '1234567')))
+    archive.archive([1])
+    db.session.commit()
+    assert ArchivedPhoneNumber.query.one().number == 501234567
+
+    response = client.post('/add-volunteer', data=volunteer_data(('50', '1234567'), fname='Noa'))
+    assert 'This phone number belongs to an archived volunteer.' in response.get_data(as_text=True)
+    assert Volunteer.query.count() == 0
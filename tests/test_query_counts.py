@@ -0,0 +1,74 @@
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+from main import db
+from main.models import Volunteer
+
+# Statements run by saving a volunteer. Areas and species are written as one bulk DELETE and one bulk INSERT per
+# association table and both phone numbers are checked in one query, so the count doesn't depend on how many
+# areas and species are chosen. Roster statistics (main.stats) are bounded separately: one upsert per counter
+# table, whatever the number of counters changed.
+COUNTER_TABLES = ('roster_count', 'last_contacted_count', 'daily_contact_count')
+COUNTER_STATEMENTS = 2
+
+
+@contextmanager
+def counted_statements():
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', count)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count)
+
+
+def counter_statements(statements):
+    return [s for s in statements if any(table in s for table in COUNTER_TABLES)]
+
+
+def volunteer_statements(statements):
+    return [s for s in statements if not any(table in s for table in COUNTER_TABLES)]
+
+
+def add_volunteer(client, areas, species):
+    return client.post('/add-volunteer', data={
+        'fname': 'Dana', 'lname': 'Levi', 'areas': areas, 'species': species,
+        'phone1-dial_code': '050', 'phone1-phone_number': '1234567',
+        'phone2-dial_code': '052', 'phone2-phone_number': '7654321'})
+
+
+@pytest.mark.parametrize('areas, species', [(['North'], ['dog']), (['North', 'South'], ['dog', 'cat']),
+                                            (['North', 'Center', 'South'], ['dog', 'cat', 'other'])])
+def test_add_volunteer_statements(client, areas, species):
+    with counted_statements() as statements:
+        response = add_volunteer(client, areas, species)
+    assert response.status_code == 200
+    assert Volunteer.query.count() == 1
+    assert len(volunteer_statements(statements)) <= 11
+    assert len(counter_statements(statements)) <= COUNTER_STATEMENTS
+    assert len(statements) <= 11 + COUNTER_STATEMENTS
+
+
+@pytest.mark.parametrize('areas, species', [(['South', 'Center'], ['cat', 'other']),
+                                            (['Center'], ['other'])])
+def test_edit_volunteer_statements(client, areas, species):
+    add_volunteer(client, ['North', 'South'], ['dog', 'cat'])
+    with counted_statements() as statements:
+        response = client.post('/1/edit', data={
+            'fname': 'Dana', 'lname': 'Cohen', 'areas': areas, 'species': species, 'active': 'y', 'version': '1',
+            'phone1-dial_code': '050', 'phone1-phone_number': '1234567', 'phone1-volunteer_id': '1',
+            'phone2-dial_code': '052', 'phone2-phone_number': '7654322', 'phone2-volunteer_id': '1'})
+    assert response.status_code == 200
+    db.session.remove()
+    volunteer = Volunteer.query.get(1)
+    assert volunteer.lname == 'Cohen'
+    assert sorted(area.area for area in volunteer.areas) == sorted(areas)
+    assert len(volunteer_statements(statements)) <= 15
+    assert len(counter_statements(statements)) <= COUNTER_STATEMENTS
+    assert len(statements) <= 15 + COUNTER_STATEMENTS